@@ -0,0 +1,339 @@
+"""Offline benchmarks for ntc commands on an in-memory fake Telegram client.
+
+A FakeClient stands in for TelegramClient, so no network or API keys are
+needed. For every scale it reports wall time, RPC count and peak traced
+memory of the main TelegramCLI commands and of the cache save/load paths.
+A scale is either one number for both the dialog count and the messages
+per chat, or DIALOGS:HISTORY to set them apart.
+
+    python bench_ntc.py [--scales 10,1000,100000] [--media 0.2] [--latency-ms 0]
+                        [--only list,select,...] [--no-memory]
+    python bench_ntc.py --scales 100:1000000,100000:10
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import nullcontext, redirect_stdout
+from types import SimpleNamespace
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import ntc
+from rich.console import Console
+from telethon import utils
+from telethon.tl import types
+
+PAGE = 100
+BASE_DATE = datetime(2026, 1, 1, tzinfo=timezone.utc)
+USER_ID_BASE = 1000
+ME = types.User(id=1, access_hash=1, first_name='Bench', is_self=True)
+
+
+class FakeDialog:
+    """The parts of telethon's Dialog that ntc reads"""
+
+    def __init__(self, entity, top, unread, message):
+        self.entity = entity
+        self.input_entity = utils.get_input_peer(entity)
+        self.id = utils.get_peer_id(entity)
+        self.name = utils.get_display_name(entity)
+        self.unread_count = unread
+        self.message = message
+        self.dialog = types.Dialog(
+            peer=utils.get_peer(entity), top_message=top, read_inbox_max_id=0, read_outbox_max_id=top // 2,
+            unread_count=unread, unread_mentions_count=0, unread_reactions_count=0,
+            unread_poll_votes_count=0, notify_settings=types.PeerNotifySettings(),
+        )
+
+
+class FakeEvent:
+    def __init__(self, chat_id, message, chat):
+        self.chat_id = chat_id
+        self.message = message
+        self.chat = chat
+
+
+class FakeClient:
+    """In-memory Telegram with `dialogs` chats of `history` messages each.
+
+    Messages are generated from their ids on demand, every request counts as
+    one RPC and sleeps `latency` seconds. Message iteration costs one RPC per
+    page of 100 like the real client.
+    """
+
+    def __init__(self, dialogs, history, media=0.2, latency=0.0):
+        self.dialog_count = dialogs
+        self.history = history
+        self.media = media
+        self.latency = latency
+        self.rpc = 0
+        self.top = {}
+        self.handlers = []
+        self.parse_mode = None
+        self.session = SimpleNamespace(takeout_id=None)
+        self._self_id = ME.id
+        self._mb_entity_cache = None
+
+    async def call(self):
+        self.rpc += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def user(self, i):
+        return types.User(id=USER_ID_BASE + i, access_hash=i, first_name=f'user{i}')
+
+    def chat_index(self, chat):
+        return utils.get_peer_id(getattr(chat, 'input_entity', chat)) - USER_ID_BASE
+
+    def top_id(self, i):
+        return self.top.get(i, self.history)
+
+    def message(self, i, msg_id):
+        user = self.user(i)
+        out = msg_id % 3 == 0
+        media = None
+        if (msg_id * 2654435761) % 100 < self.media * 100:
+            if msg_id % 2:
+                media = types.MessageMediaPhoto(photo=types.Photo(
+                    id=msg_id, access_hash=i, file_reference=b'', date=None, sizes=[], dc_id=2))
+            else:
+                media = types.MessageMediaDocument(document=types.Document(
+                    id=msg_id, access_hash=i, file_reference=b'', date=None, mime_type='application/pdf',
+                    size=msg_id * 1000, dc_id=2, attributes=[types.DocumentAttributeFilename(f'doc{msg_id}.pdf')]))
+        msg = types.Message(
+            id=msg_id, peer_id=types.PeerUser(user.id), date=BASE_DATE + timedelta(minutes=msg_id),
+            message=f'message {msg_id} about topic{msg_id % 50} with **bold** and `code`', out=out,
+            from_id=None if out else types.PeerUser(user.id), media=media,
+        )
+        msg._finish_init(self, {user.id: user}, None)
+        return msg
+
+    def window(self, i, limit=None, offset_id=0, add_offset=0, reverse=False, max_id=0, min_id=0):
+        """Message ids the server would return, newest first unless reverse"""
+        top = self.top_id(i)
+        low = min_id + 1
+        high = min(top, max_id - 1) if max_id else top
+        if reverse:
+            ids = range(max(low, offset_id + 1), high + 1)
+        else:
+            ids = range(min(high, offset_id - 1) if offset_id else high, low - 1, -1)[add_offset:]
+        return ids[:limit] if limit else ids
+
+    async def start(self):
+        await self.call()
+
+    async def disconnect(self):
+        pass
+
+    def on(self, event):
+        def register(handler):
+            self.handlers.append((event, handler))
+            return handler
+        return register
+
+    async def get_me(self):
+        await self.call()
+        return ME
+
+    async def get_entity(self, peer):
+        await self.call()
+        return ME if peer in (ME.id, 'me') else self.user(self.chat_index(peer))
+
+    async def get_permissions(self, chat, user=None):
+        await self.call()
+        return None
+
+    async def __call__(self, request):
+        await self.call()
+        return None
+
+    async def iter_dialogs(self, limit=None):
+        count = min(limit or self.dialog_count, self.dialog_count)
+        for i in range(count):
+            if i % PAGE == 0:
+                await self.call()
+            top = self.top_id(i)
+            yield FakeDialog(self.user(i), top, i % 7, self.message(i, top) if top else None)
+
+    def takeout(self, finalize=True, **scopes):
+        return nullcontext(self)
+
+    async def iter_messages(self, chat, limit=None, search=None, offset_date=None, wait_time=None, **window):
+        i = self.chat_index(chat)
+        ids = self.window(i, None if search else limit, **window)
+        found = 0
+        await self.call()
+        for n, msg_id in enumerate(ids):
+            if n and n % PAGE == 0:
+                await self.call()
+            msg = self.message(i, msg_id)
+            if search and search not in msg.message:
+                continue
+            yield msg
+            found += 1
+            if limit and found >= limit:
+                return
+
+    async def get_messages(self, chat, ids=None, limit=None, **window):
+        i = self.chat_index(chat)
+        await self.call()
+        if ids is not None:
+            if isinstance(ids, list):
+                return [self.message(i, msg_id) if 0 < msg_id <= self.top_id(i) else None for msg_id in ids]
+            return self.message(i, ids) if 0 < ids <= self.top_id(i) else None
+        return [self.message(i, msg_id) for msg_id in self.window(i, limit or 1, **window)]
+
+    async def send_message(self, chat, text, **kwargs):
+        i = self.chat_index(chat)
+        await self.call()
+        self.top[i] = self.top_id(i) + 1
+        msg = self.message(i, self.top[i])
+        msg.message = text
+        msg.out = True
+        return msg
+
+
+class Bench:
+    def __init__(self, dialogs, history, media, latency, memory):
+        self.dialogs = dialogs
+        self.history = history
+        self.memory = memory
+        self.client = FakeClient(dialogs, history, media, latency)
+        self.cli = ntc.TelegramCLI()
+        self.cli._client = self.client
+        self.cli.console = Console(file=open(os.devnull, 'w'), width=120)
+        self.results = []
+
+    async def measure(self, name, action):
+        self.client.rpc = 0
+        if self.memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            await action()
+        elapsed = time.perf_counter() - started
+        peak = 0
+        if self.memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.results.append((name, elapsed, self.client.rpc, peak))
+
+    async def prepare(self, needs):
+        """Unreported setup, so every --only group runs on its own"""
+        cli = self.cli
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            if needs and not cli.dialogs:
+                await cli.list_chats()
+            if needs == 'chat' and not cli.current_chat:
+                await cli.select_chat(1)
+
+    def chat(self, i):
+        return ntc.CachedDialog(USER_ID_BASE + i, f'user{i}', self.client.user(i),
+                                utils.get_input_peer(self.client.user(i)), top_message=self.client.top_id(i))
+
+    async def run(self, only):
+        cli, client, dialogs, per_chat = self.cli, self.client, self.dialogs, self.history
+        all_dialogs = [self.chat(i) for i in range(dialogs)]
+        history = [client.message(0, msg_id) for msg_id in range(1, per_chat + 1)]
+
+        async def list_warm():
+            await cli.list_chats()
+
+        async def select_warm(num):
+            await cli.select_chat(num)
+            if cli.reconcile_task and not cli.reconcile_task.done():
+                await cli.reconcile_task
+
+        async def store_upsert():
+            for start in range(0, per_chat, ntc.HISTORY_CHUNK):
+                cli.message_store.upsert(cli.current_chat.id, history[start:start + ntc.HISTORY_CHUNK])
+
+        async def store_load():
+            cli.message_store.load_chat(cli.current_chat.id, client)
+
+        async def dialogs_save():
+            cli.save_cache(all_dialogs)
+
+        async def dialogs_load():
+            cli.load_cache()
+
+        async def new_messages():
+            # Every tenth message lands in the open chat, the rest elsewhere
+            for n in range(per_chat):
+                i = 0 if n % 10 == 0 else n % dialogs
+                msg = client.message(i, client.top_id(i) + 1)
+                client.top[i] = msg.id
+                await cli.on_new_message(FakeEvent(USER_ID_BASE + i, msg, client.user(i)))
+
+        # Group, name, action and the state it needs: a dialog list or a selected chat
+        steps = [
+            ('list', 'list cold', lambda: cli.list_chats(), None),
+            ('list', 'list warm', list_warm, None),
+            ('select', 'select cold', lambda: cli.select_chat(1), 'dialogs'),
+            ('msg', 'msg 15 --before', lambda: cli.show_messages(15, before=True), 'chat'),
+            ('msg', f'msg {per_chat}', lambda: cli.show_messages(per_chat), 'chat'),
+            ('cache', 'store upsert', store_upsert, 'chat'),
+            ('cache', 'store load', store_load, 'chat'),
+            ('cache', 'dialogs save', dialogs_save, None),
+            ('cache', 'dialogs load', dialogs_load, None),
+            ('select', 'select warm', lambda: select_warm(1), 'dialogs'),
+            ('search', 'search chat', lambda: cli.search_messages('topic7'), 'chat'),
+            ('search', 'search --all', lambda: cli.search_messages('topic7 --all'), 'chat'),
+            ('new', f'new message x{per_chat}', new_messages, 'chat'),
+            ('send', 'send', lambda: cli.send_msg('hello'), 'chat'),
+            ('select', 'select updated', lambda: select_warm(2), 'dialogs'),
+        ]
+        for group, name, action, needs in steps:
+            if only and group not in only:
+                continue
+            await self.prepare(needs)
+            await self.measure(name, action)
+        return self.results
+
+
+def parse_scale(spec):
+    """"1000" or "100:1000000" into (dialogs, messages per chat)"""
+    dialogs, _, history = spec.partition(':')
+    return int(dialogs), int(history or dialogs)
+
+
+def report(dialogs, history, results, memory):
+    print(f"\nscale {dialogs}:{history}: {dialogs} dialogs, {history} messages per chat")
+    print(f"{'command':<24}{'wall ms':>12}{'rpc':>8}{'peak KiB':>12}")
+    for name, elapsed, rpc, peak in results:
+        peak_text = f"{peak / 1024:>12.0f}" if memory else f"{'-':>12}"
+        print(f"{name:<24}{elapsed * 1000:>12.1f}{rpc:>8}{peak_text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', default='10,1000,100000', help='N or DIALOGS:HISTORY, comma separated')
+    parser.add_argument('--media', type=float, default=0.2, help='share of messages with media')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='simulated delay per RPC')
+    parser.add_argument('--only', default='', help='groups: list,select,msg,cache,search,new,send')
+    parser.add_argument('--no-memory', action='store_true', help='skip tracemalloc for cleaner timings')
+    args = parser.parse_args()
+
+    only = set(filter(None, args.only.split(',')))
+    memory = not args.no_memory
+    cwd = os.getcwd()
+    for dialogs, history in (parse_scale(s) for s in args.scales.split(',')):
+        # Each scale starts from empty caches in its own scratch directory
+        with tempfile.TemporaryDirectory() as scratch:
+            os.chdir(scratch)
+            try:
+                bench = Bench(dialogs, history, args.media, args.latency_ms / 1000, memory)
+                results = asyncio.run(bench.run(only))
+                bench.cli.message_store.close()
+            finally:
+                os.chdir(cwd)
+        report(dialogs, history, results, memory)
+
+
+if __name__ == '__main__':
+    main()
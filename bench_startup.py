@@ -0,0 +1,89 @@
+"""Startup-time benchmark for ntc.
+
+Runs the local-only commands and a bare import in a scratch directory and
+fails when they get slow, touch Telethon, prompt for API keys or leave
+files behind.
+
+    python bench_startup.py [--runs N] [--budget-ms MS]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+NTC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ntc.py')
+
+IMPORT_CHECK = f'''
+import os, sys
+sys.path.insert(0, {os.path.dirname(NTC)!r})
+import ntc
+assert 'telethon' not in sys.modules, 'telethon imported at import time'
+assert 'dotenv' not in sys.modules, 'dotenv imported at import time'
+assert os.listdir('.') == [], 'import created ' + ', '.join(os.listdir('.'))
+'''
+
+# Name, command and the files it may leave in the working directory
+CASES = [
+    ('python', [sys.executable, '-c', 'pass'], set()),
+    ('import ntc', [sys.executable, '-c', IMPORT_CHECK], set()),
+    ('ntc --help', [sys.executable, NTC, '--help'], set()),
+    ('ntc --about', [sys.executable, NTC, '--about'], set()),
+    ('ntc --theme dark', [sys.executable, NTC, '--theme', 'dark'], {'.ntc_config'}),
+    ('ntc --lang en', [sys.executable, NTC, '--lang', 'en'], set()),
+]
+
+
+def run_case(cmd, allowed, runs):
+    """Wall times in ms of running cmd in fresh scratch directories"""
+    env = {k: v for k, v in os.environ.items() if k not in ('API_ID', 'API_HASH')}
+    times = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as scratch:
+            started = time.perf_counter()
+            # No stdin and no keys: anything that prompts for API keys fails here
+            result = subprocess.run(cmd, cwd=scratch, env=env, stdin=subprocess.DEVNULL,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=60)
+            times.append((time.perf_counter() - started) * 1000)
+            created = set(os.listdir(scratch)) - allowed
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.decode(errors='replace').strip().splitlines()[-1])
+        if created:
+            raise RuntimeError('created ' + ', '.join(sorted(created)))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--budget-ms', type=float, default=400,
+                        help='max median time above bare python startup')
+    args = parser.parse_args()
+
+    failed = False
+    baseline = None
+    print(f"{'case':<20}{'min ms':>10}{'median ms':>12}{'over python':>14}")
+    for name, cmd, allowed in CASES:
+        try:
+            times = run_case(cmd, allowed, args.runs)
+        except Exception as e:
+            print(f"{name:<20}FAIL {e}")
+            failed = True
+            continue
+        median = statistics.median(times)
+        if baseline is None:
+            baseline = median
+        over = median - baseline
+        status = ''
+        if over > args.budget_ms:
+            status = '  over budget'
+            failed = True
+        print(f"{name:<20}{min(times):>10.1f}{median:>12.1f}{over:>14.1f}{status}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,40 +1,145 @@
 import asyncio
-from telethon import TelegramClient, events
-from telethon.tl import types
-from telethon.tl.functions.account import UpdateProfileRequest, UpdateUsernameRequest
-from telethon.tl.functions.auth import LogOutRequest
-from telethon.tl.functions.messages import EditMessageRequest, DeleteMessagesRequest, SendReactionRequest
-from telethon.errors import ChatRestrictedError, ChatWriteForbiddenError, MessageNotModifiedError
-from dotenv import load_dotenv
 import os
-from collections import defaultdict
+import sqlite3
+from collections import defaultdict, deque, OrderedDict, Counter
 import time
+import threading
 import random
 import sys
 import pickle
 import unicodedata
 import argparse
+import contextvars
+import importlib
 import re
 import json
+import glob
+import hashlib
+import io
+import shutil
+from datetime import datetime, timedelta
+from contextlib import contextmanager, nullcontext, redirect_stdout, redirect_stderr, AsyncExitStack
 from rich.console import Console
 from rich.table import Table
 from rich.panel import Panel
 from rich.text import Text
-from rich.style import Style
-from rich.theme import Theme
-from rich.markdown import Markdown
-
-load_dotenv()
+from rich.markup import escape
+from rich.progress import Progress, SpinnerColumn, TextColumn, TimeElapsedColumn, BarColumn, DownloadColumn, TransferSpeedColumn
+
+class LazyModule:
+    """Stand-in that imports the real module on first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+# Telethon takes most of the startup time, so it is only imported once a command needs it
+telethon = LazyModule('telethon')
+events = LazyModule('telethon.events')
+utils = LazyModule('telethon.utils')
+types = LazyModule('telethon.tl.types')
+functions = LazyModule('telethon.tl.functions')
+errors = LazyModule('telethon.errors')
+helpers = LazyModule('telethon.helpers')
+extensions = LazyModule('telethon.extensions')
 
 SESSION_NAME = 'telegram_cli_session'
 MEDIA_DIR = 'downloads'
+MEDIA_INDEX_FILE = os.path.join(MEDIA_DIR, '.media_index.json')
+MEDIA_INDEX_FLUSH_DELAY = 1.0
 CACHE_FILE = 'dialogs_cache.pkl'
 CONFIG_FILE = '.ntc_config'
+DAEMON_SOCKET = 'ntc.sock'
 DRAFTS_FILE = 'drafts.json'
-MESSAGE_CACHE_FILE = 'message_cache.pkl'
+DRAFT_FLUSH_DELAY = 1.0
+DIALOG_FLUSH_DELAY = 2.0
+PREVIEW_LENGTH = 40
+SEARCH_PAGE_SIZE = 15
+DOWNLOAD_WORKERS = 3
+DOWNLOAD_CHUNK = 512 * 1024
+LARGE_FILE_THRESHOLD_MB = 20
+LARGE_FILE_CONNECTIONS = 4
+UPLOAD_PART_SIZE = 512 * 1024
+UPLOAD_BIG_FILE = 10 * 1048576
+UPLOAD_FILES_CONCURRENCY = 3
+ALBUM_SIZE = 10
+# Most message ids Telegram accepts in one delete or forward request
+BATCH_SIZE = 100
+HISTORY_CHUNK = 50
+RENDER_CACHE_SIZE = 5000
+PREFETCH_DIALOGS = 5
+PREFETCH_MESSAGES = 45
+PREFETCH_BUDGET = 10
+PREFETCH_IDLE = 2.0
+
+MARKDOWN_RE = re.compile(
+    r'\*\*(.+?)\*\*|~~(.+?)~~|__(.+?)__|\|\|(.+?)\|\||`(.+?)`'
+    r'|(?<!\*)\*(?!\*)(.+?)(?<!\*)\*(?!\*)|(?<!_)_(?!_)(.+?)(?<!_)_(?!_)'
+)
+MARKDOWN_STYLES = ('bold', 'strike', 'underline', 'dim', 'reverse', 'italic', 'italic')
+ENTITY_STYLES = {
+    'MessageEntityBold': 'bold',
+    'MessageEntityItalic': 'italic',
+    'MessageEntityUnderline': 'underline',
+    'MessageEntityStrike': 'strike',
+    'MessageEntityCode': 'reverse',
+    'MessageEntityPre': 'reverse',
+    'MessageEntitySpoiler': 'dim',
+    'MessageEntityBlockquote': 'italic dim',
+    'MessageEntityUrl': 'underline',
+    'MessageEntityMention': 'cyan',
+    'MessageEntityMentionName': 'cyan',
+    'MessageEntityHashtag': 'cyan',
+}
+MEDIA_LABELS = {'img': 'IMG', 'sticker': 'STK', 'video': 'VID', 'audio': 'AUD', 'document': 'DOC', 'gif': 'GIF', 'voice': 'VCE'}
+MESSAGE_DB_FILE = 'messages.db'
+EXPORT_DIR = 'exports'
+# Messages between export checkpoints, and messages held back while their media downloads
+EXPORT_CHECKPOINT = 500
+EXPORT_MEDIA_WINDOW = 50
+FOLDER_PAGE_SIZE = 20
+# Marked channel ids are -(10**12 + id), everything above is a user or basic group
+CHANNEL_ID_LIMIT = -10**12
+ME_TTL = 3600
+ENTITY_TTL = 600
+PERMISSIONS_TTL = 300
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+LOOP_LAG_INTERVAL = 0.1
+# Requests per second and burst per request type, '*' for everything else
+REQUEST_LIMITS = {
+    '*': (30, 30),
+    'GetDialogsRequest': (2, 4),
+    'GetHistoryRequest': (10, 10),
+    'SearchRequest': (5, 5),
+    'SendMessageRequest': (5, 5),
+    'SendMediaRequest': (3, 3),
+    'SendMultiMediaRequest': (1, 2),
+    'ForwardMessagesRequest': (5, 5),
+    'DeleteMessagesRequest': (5, 5),
+    'SendReactionRequest': (5, 5),
+    # Exports run inside a takeout session, which Telegram allows to fetch faster
+    'InvokeWithTakeoutRequest': (20, 20),
+}
+# File parts go over their own connections and are not rate limited
+FILE_REQUESTS = {'GetFileRequest', 'GetCdnFileRequest', 'SaveFilePartRequest', 'SaveBigFilePartRequest'}
+FLOOD_WAIT_MAX = 60
+BACKGROUND_CONCURRENCY = 2
+SCHEDULER_TICK = 0.05
+INTERACTIVE, BACKGROUND = 0, 1
+# One-shot options that never need the network
+LOCAL_OPTIONS = {'help', 'about', 'theme', 'lang'}
+# One-shot options that only report on a running daemon's session
+DAEMON_OPTIONS = {'downloads', 'stats'}
 
 def get_or_prompt_api_keys():
     """Get API ID and HASH from .env or prompt user"""
+    from dotenv import load_dotenv
+    load_dotenv()
     api_id = os.getenv('API_ID')
     api_hash = os.getenv('API_HASH')
 
@@ -58,11 +163,6 @@ def get_or_prompt_api_keys():
     print("\n✓ Saved to .env\n")
     return api_id, api_hash
 
-API_ID, API_HASH = get_or_prompt_api_keys()
-
-if not os.path.exists(MEDIA_DIR):
-    os.makedirs(MEDIA_DIR)
-
 class C:
     PUR = '\033[95m'
     GRAY = '\033[90m'
@@ -87,24 +187,28 @@ THEMES = {
         'secondary': '\033[90m',
         'accent': '\033[97m',
         'dim': '\033[2m',
+        'rich': 'magenta',
     },
     'light': {
         'primary': '\033[94m',
         'secondary': '\033[37m',
         'accent': '\033[30m',
         'dim': '\033[2m',
+        'rich': 'blue',
     },
     'purple': {
         'primary': '\033[95m',
         'secondary': '\033[35m',
         'accent': '\033[97m',
         'dim': '\033[2m',
+        'rich': 'magenta',
     },
     'matrix': {
         'primary': '\033[92m',
         'secondary': '\033[32m',
         'accent': '\033[97m',
         'dim': '\033[2m',
+        'rich': 'green',
     },
 }
 
@@ -139,29 +243,938 @@ CMD_ALIASES = {
     't': 'text',
     'th': 'theme',
     'lang': 'language',
+    'fo': 'folders',
+    'fd': 'folder',
+    'ca': 'cache',
+    'dl': 'downloads',
+    'st': 'stats',
+    'ex': 'export',
 }
 
+def parse_ranges(spec):
+    """Parse "3-20,25" style number lists into a sorted list of ints"""
+    numbers = set()
+    for part in str(spec).replace(' ', ',').split(','):
+        if not part:
+            continue
+        if '-' in part[1:]:
+            start, end = (int(x) for x in part.split('-', 1))
+            numbers.update(range(min(start, end), max(start, end) + 1))
+        else:
+            numbers.add(int(part))
+    return sorted(numbers)
+
+def plural(n, noun):
+    return f"{n} {noun}" if n == 1 else f"{n} {noun}s"
+
+def format_bytes(n):
+    for unit in ('B', 'KB', 'MB'):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == 'B' else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+class MessageStore:
+    """On-disk message cache, one row per message keyed by (chat_id, msg_id)"""
+    MIGRATIONS = [
+        """
+        CREATE TABLE IF NOT EXISTS messages (
+            chat_id INTEGER NOT NULL,
+            msg_id INTEGER NOT NULL,
+            date INTEGER,
+            edit_date INTEGER,
+            out INTEGER NOT NULL DEFAULT 0,
+            sender TEXT,
+            text TEXT,
+            raw BLOB NOT NULL,
+            PRIMARY KEY (chat_id, msg_id)
+        );
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS messages_date ON messages (date);
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS entities (
+            peer_id INTEGER PRIMARY KEY,
+            raw BLOB NOT NULL
+        );
+        """,
+    ]
+    FTS_SCHEMA = """
+        CREATE VIRTUAL TABLE messages_fts USING fts5(
+            text, sender, content='messages', content_rowid='rowid',
+            tokenize='unicode61 remove_diacritics 2'
+        );
+        CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, text, sender) VALUES (new.rowid, new.text, new.sender);
+        END;
+        CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, text, sender) VALUES ('delete', old.rowid, old.text, old.sender);
+        END;
+        CREATE TRIGGER messages_fts_update AFTER UPDATE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, text, sender) VALUES ('delete', old.rowid, old.text, old.sender);
+            INSERT INTO messages_fts (rowid, text, sender) VALUES (new.rowid, new.text, new.sender);
+        END;
+        INSERT INTO messages_fts (messages_fts) VALUES ('rebuild');
+    """
+
+    def __init__(self, path=MESSAGE_DB_FILE):
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        version = self.db.execute('PRAGMA user_version').fetchone()[0]
+        for number, migration in enumerate(self.MIGRATIONS[version:], version + 1):
+            self.db.executescript(f"{migration}\nPRAGMA user_version = {number};")
+        self.fts = self._init_fts()
+
+    def _init_fts(self):
+        """Create the full-text index if this sqlite build has FTS5"""
+        if self.db.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone():
+            return True
+        try:
+            self.db.executescript(self.FTS_SCHEMA)
+            return True
+        except sqlite3.OperationalError:
+            return False
+
+    @staticmethod
+    def _row(chat_id, msg):
+        sender = getattr(msg, 'sender', None)
+        sender_name = getattr(sender, 'first_name', None) or getattr(sender, 'title', None)
+        return (
+            chat_id,
+            msg.id,
+            int(msg.date.timestamp()) if msg.date else None,
+            int(msg.edit_date.timestamp()) if getattr(msg, 'edit_date', None) else None,
+            1 if msg.out else 0,
+            sender_name,
+            getattr(msg, 'message', None),
+            bytes(msg),
+        )
+
+    def upsert(self, chat_id, msgs):
+        """Insert or update the given messages only"""
+        rows = []
+        for msg in msgs:
+            try:
+                rows.append(self._row(chat_id, msg))
+            except:
+                continue
+        if not rows:
+            return
+        # Senders and chats are kept too, so cached messages show who wrote them
+        entities = {}
+        for msg in msgs:
+            for entity in (getattr(msg, 'sender', None), getattr(msg, 'chat', None)):
+                if entity is not None:
+                    try:
+                        entities[utils.get_peer_id(entity)] = bytes(entity)
+                    except:
+                        continue
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO entities (peer_id, raw) VALUES (?, ?)',
+                                entities.items())
+            self.db.executemany("""
+                INSERT INTO messages (chat_id, msg_id, date, edit_date, out, sender, text, raw)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (chat_id, msg_id) DO UPDATE SET
+                    date = excluded.date,
+                    edit_date = excluded.edit_date,
+                    out = excluded.out,
+                    sender = COALESCE(excluded.sender, messages.sender),
+                    text = excluded.text,
+                    raw = excluded.raw
+            """, rows)
+
+    def delete(self, chat_id, msg_ids):
+        with self.db:
+            self.db.executemany('DELETE FROM messages WHERE chat_id = ? AND msg_id = ?',
+                                [(chat_id, i) for i in msg_ids])
+
+    def delete_unscoped(self, msg_ids):
+        """Delete by id in every non-channel chat, where ids are account-wide"""
+        with self.db:
+            self.db.executemany('DELETE FROM messages WHERE msg_id = ? AND chat_id > ?',
+                                [(i, CHANNEL_ID_LIMIT) for i in msg_ids])
+
+    def load_chat(self, chat_id, client=None, limit=None, ids=None):
+        """Load cached messages of one chat as {msg_id: Message}, oldest first.
+
+        limit keeps only the newest messages and ids only the given ones, so
+        the cost follows what is shown rather than the size of the history.
+        """
+        if ids is not None:
+            ids = list(ids)
+            rows = []
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows += self.db.execute(
+                    f"SELECT msg_id, raw FROM messages WHERE chat_id = ? AND msg_id IN ({','.join('?' * len(chunk))})",
+                    [chat_id, *chunk]).fetchall()
+            rows.sort()
+        elif limit is not None:
+            rows = self.db.execute(
+                'SELECT msg_id, raw FROM messages WHERE chat_id = ? ORDER BY msg_id DESC LIMIT ?',
+                (chat_id, limit)).fetchall()[::-1]
+        else:
+            rows = self.db.execute(
+                'SELECT msg_id, raw FROM messages WHERE chat_id = ? ORDER BY msg_id', (chat_id,))
+        messages = {}
+        for msg_id, raw in rows:
+            try:
+                messages[msg_id] = extensions.BinaryReader(raw).tgread_object()
+            except:
+                continue
+        if client is not None:
+            peers = {msg.sender_id for msg in messages.values()} | {msg.chat_id for msg in messages.values()}
+            entities = self.load_entities(peers)
+            for msg in messages.values():
+                msg._finish_init(client, entities, None)
+        return messages
+
+    def load_entities(self, peer_ids):
+        """Stored users, chats and channels as {peer_id: entity}"""
+        peer_ids = [p for p in peer_ids if p is not None]
+        entities = {}
+        for start in range(0, len(peer_ids), 500):
+            chunk = peer_ids[start:start + 500]
+            for peer_id, raw in self.db.execute(
+                    f"SELECT peer_id, raw FROM entities WHERE peer_id IN ({','.join('?' * len(chunk))})", chunk):
+                try:
+                    entities[peer_id] = extensions.BinaryReader(raw).tgread_object()
+                except:
+                    continue
+        return entities
+
+    def chat_stats(self, chat_id):
+        """Newest cached msg_id and number of cached messages of one chat"""
+        row = self.db.execute(
+            'SELECT MAX(msg_id), COUNT(*) FROM messages WHERE chat_id = ?', (chat_id,)).fetchone()
+        return row[0] or 0, row[1]
+
+    @staticmethod
+    def _fts_query(query):
+        # Quote every word so user input can't break the FTS5 syntax, prefix-match each
+        words = [w.replace('"', '""') for w in query.split()]
+        return ' '.join(f'"{w}"*' for w in words)
+
+    def search(self, query, chat_id=None, since=None, until=None, limit=SEARCH_PAGE_SIZE, offset=0):
+        """Ranked local search, returns (chat_id, msg_id, date, out, sender, snippet) rows"""
+        where, params = [], []
+        if chat_id is not None:
+            where.append('m.chat_id = ?')
+            params.append(chat_id)
+        if since is not None:
+            where.append('m.date >= ?')
+            params.append(int(since.timestamp()))
+        if until is not None:
+            where.append('m.date < ?')
+            params.append(int(until.timestamp()))
+
+        if self.fts:
+            sql = """
+                SELECT m.chat_id, m.msg_id, m.date, m.out, m.sender,
+                       snippet(messages_fts, 0, '\x02', '\x03', '…', 12)
+                FROM messages_fts JOIN messages m ON m.rowid = messages_fts.rowid
+                WHERE messages_fts MATCH ?
+            """
+            params.insert(0, self._fts_query(query))
+            order = 'ORDER BY bm25(messages_fts), m.date DESC'
+        else:
+            sql = """
+                SELECT m.chat_id, m.msg_id, m.date, m.out, m.sender, m.text
+                FROM messages m WHERE m.text LIKE ?
+            """
+            params.insert(0, f"%{query}%")
+            order = 'ORDER BY m.date DESC'
+        if where:
+            sql += ' AND ' + ' AND '.join(where)
+        sql += f' {order} LIMIT ? OFFSET ?'
+        params += [limit, offset]
+        return self.db.execute(sql, params).fetchall()
+
+    def close(self):
+        try:
+            self.db.close()
+        except:
+            pass
+
+class CachedDialog:
+    """Picklable dialog row that can be used as a peer like telethon's Dialog"""
+
+    def __init__(self, id, name, entity, input_entity, unread_count=0, top_message=0, read_outbox_max_id=0,
+                 preview=''):
+        self.id = id
+        self.name = name
+        self.entity = entity
+        self.input_entity = input_entity
+        self.unread_count = unread_count
+        self.top_message = top_message
+        self.read_outbox_max_id = read_outbox_max_id
+        self.preview = preview
+
+    @classmethod
+    def from_dialog(cls, d):
+        return cls(d.id, d.name, d.entity, d.input_entity, d.unread_count, d.dialog.top_message,
+                   d.dialog.read_outbox_max_id, message_preview(d.message))
+
+    @classmethod
+    def from_cache(cls, data):
+        entity = extensions.BinaryReader(data['entity']).tgread_object()
+        return cls(data['id'], data['name'], entity, utils.get_input_peer(entity),
+                   data['unread_count'], data['top_message'], data.get('read_outbox_max_id', 0),
+                   data.get('preview', ''))
+
+    def to_cache(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'entity': bytes(self.entity),
+            'unread_count': self.unread_count,
+            'top_message': self.top_message,
+            'read_outbox_max_id': self.read_outbox_max_id,
+            'preview': self.preview,
+        }
+
+    def changed(self, other):
+        return (self.name, self.unread_count, self.top_message) != \
+               (other.name, other.unread_count, other.top_message)
+
+def message_preview(msg):
+    """One-line summary of a message for the chat list"""
+    if msg is None:
+        return ''
+    text = getattr(msg, 'message', None) or ('[media]' if getattr(msg, 'media', None) else '')
+    return ' '.join(text.split())[:PREVIEW_LENGTH]
+
+async def run_concurrently(coros):
+    """Gather coroutines, cancelling the rest as soon as one fails"""
+    tasks = [asyncio.create_task(c) for c in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+class MediaStore:
+    """Index of downloaded media keyed by Telegram photo/document id and access hash"""
+
+    def __init__(self, path=MEDIA_INDEX_FILE):
+        self.path = path
+        self.index = {}
+        self.dirty = False
+        self.save_task = None
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.index = json.load(f)
+            except:
+                pass
+
+    @staticmethod
+    def key(media):
+        media = getattr(media, 'photo', None) or getattr(media, 'document', None)
+        if isinstance(media, types.Photo):
+            return f"photo:{media.id}:{media.access_hash}"
+        if isinstance(media, types.Document):
+            return f"document:{media.id}:{media.access_hash}"
+        return None
+
+    def lookup(self, key):
+        """Path of an already downloaded copy, or None"""
+        path = self.index.get(key) if key else None
+        if path and not os.path.exists(path):
+            del self.index[key]
+            self.save_later()
+            return None
+        return path
+
+    def add(self, key, path):
+        if key and self.lookup(key) is None:
+            self.index[key] = path
+            self.save_later()
+
+    def serve(self, key, target):
+        """Hardlink a stored copy to target, returns the path that now holds the file"""
+        stored = self.lookup(key)
+        if stored is None:
+            return None
+        if os.path.abspath(stored) == os.path.abspath(target) or os.path.exists(target):
+            return target
+        try:
+            os.link(stored, target)
+            return target
+        except OSError:
+            # Filesystem without hardlinks, point at the stored copy instead of copying
+            return stored
+
+    def save_later(self):
+        """Coalesce index writes from a batch of downloads into one"""
+        self.dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        if self.save_task is None or self.save_task.done():
+            self.save_task = loop.create_task(self.writer())
+
+    async def writer(self):
+        await asyncio.sleep(MEDIA_INDEX_FLUSH_DELAY)
+        self.flush()
+
+    def flush(self):
+        """Write the index right now if it changed"""
+        if self.dirty:
+            self.dirty = False
+            self.save()
+
+    def save(self):
+        tmp_file = f"{self.path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f)
+            os.replace(tmp_file, self.path)
+        except:
+            pass
+
+class DownloadItem:
+    def __init__(self, num, msg, path, refresh):
+        self.num = num
+        self.msg = msg
+        self.path = path
+        self.refresh = refresh
+        self.status = 'queued'
+        self.received = 0
+        self.total = getattr(msg.file, 'size', None)
+        self.error = None
+        self.local = False
+        self.started = None
+        self.finished = None
+
+    @property
+    def speed(self):
+        if not self.started:
+            return 0
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return self.received / elapsed if elapsed > 0 else 0
+
+class DownloadManager:
+    """Background download queue with a concurrency limit and resumable .part files"""
+
+    def __init__(self, client, workers=DOWNLOAD_WORKERS, on_finish=None,
+                 large_threshold=LARGE_FILE_THRESHOLD_MB * 1048576, connections=LARGE_FILE_CONNECTIONS,
+                 media_store=None):
+        self.client = client
+        self.media_store = media_store
+        self.workers_count = workers
+        self.on_finish = on_finish
+        self.large_threshold = large_threshold
+        self.connections = connections
+        self.items = []
+        self.paths = set()
+        self.queue = None
+        self.workers = []
+
+    def add(self, item):
+        """Queue an item unless the same file is already known, returns True if queued"""
+        if item.path in self.paths:
+            return False
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+            self.workers = [asyncio.create_task(self.worker()) for _ in range(self.workers_count)]
+        self.paths.add(item.path)
+        self.items = [i for i in self.items if i.path != item.path]
+        self.items.append(item)
+        self.queue.put_nowait(item)
+        return True
+
+    async def worker(self):
+        while True:
+            item = await self.queue.get()
+            item.status = 'active'
+            item.started = time.monotonic()
+            try:
+                key = MediaStore.key(item.msg.media)
+                served = self.media_store.serve(key, item.path) if self.media_store else None
+                if served:
+                    item.path, item.local = served, True
+                elif not os.path.exists(item.path):
+                    await self.fetch(item)
+                if self.media_store:
+                    self.media_store.add(key, item.path)
+                item.received = item.total = os.path.getsize(item.path)
+                item.status = 'done'
+            except Exception as e:
+                item.status = 'failed'
+                item.error = f"{type(e).__name__}: {e}"
+                # Forget it so the same command can retry and resume the .part file
+                self.paths.discard(item.path)
+            finally:
+                item.finished = time.monotonic()
+                self.queue.task_done()
+            if self.on_finish:
+                self.on_finish(item)
+
+    async def fetch(self, item):
+        if item.total and item.total >= self.large_threshold and self.connections > 1:
+            try:
+                await self.fetch_parallel(item)
+            except errors.FileReferenceExpiredError:
+                item.msg = await item.refresh()
+                await self.fetch_parallel(item)
+            return
+
+        part = f"{item.path}.part"
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        offset -= offset % DOWNLOAD_CHUNK
+        try:
+            await self.write_from(item, part, offset)
+        except errors.FileReferenceExpiredError:
+            item.msg = await item.refresh()
+            await self.write_from(item, part, os.path.getsize(part) // DOWNLOAD_CHUNK * DOWNLOAD_CHUNK)
+        os.replace(part, item.path)
+
+    async def write_from(self, item, part, offset):
+        with open(part, 'r+b' if offset else 'wb') as f:
+            f.truncate(offset)
+            f.seek(offset)
+            item.received = offset
+            async for chunk in self.client.iter_download(item.msg.media, offset=offset, request_size=DOWNLOAD_CHUNK):
+                f.write(chunk)
+                item.received += len(chunk)
+
+    async def fetch_parallel(self, item):
+        """Fetch a large file as concurrent part requests written at their offsets"""
+        part, log = f"{item.path}.part", f"{item.path}.part.chunks"
+        chunks = (item.total + DOWNLOAD_CHUNK - 1) // DOWNLOAD_CHUNK
+        done = set()
+        if os.path.exists(part) and os.path.exists(log):
+            with open(log) as f:
+                done = {int(line) for line in f if line.strip().isdigit()}
+        else:
+            # Preallocate so every part can be written straight to its offset
+            with open(part, 'wb') as f:
+                f.truncate(item.total)
+            open(log, 'w').close()
+
+        pending = [i for i in range(chunks) if i not in done]
+        pending.reverse()
+        item.received = min(len(done) * DOWNLOAD_CHUNK, item.total)
+
+        with open(part, 'r+b') as f, open(log, 'a', buffering=1) as log_f:
+            async def connection():
+                while pending:
+                    idx = pending.pop()
+                    async for data in self.client.iter_download(
+                            item.msg.media, offset=idx * DOWNLOAD_CHUNK, limit=1,
+                            request_size=DOWNLOAD_CHUNK, file_size=item.total):
+                        # No await between seek and write, so parts can't interleave
+                        f.seek(idx * DOWNLOAD_CHUNK)
+                        f.write(data)
+                        item.received += len(data)
+                    # The log must never list a part that is not on disk yet
+                    f.flush()
+                    os.fsync(f.fileno())
+                    log_f.write(f"{idx}\n")
+
+            await run_concurrently(connection() for _ in range(min(self.connections, len(pending) or 1)))
+
+        os.replace(part, item.path)
+        os.remove(log)
+
+    async def join(self):
+        if self.queue is not None:
+            await self.queue.join()
+
+    def stop(self):
+        for task in self.workers:
+            task.cancel()
+        if self.media_store:
+            self.media_store.flush()
+
+    def totals(self):
+        """Aggregate (received, total) bytes over unfinished and done items"""
+        items = [i for i in self.items if i.status != 'failed']
+        return sum(i.received for i in items), sum(i.total or i.received for i in items)
+
+class TTLCache:
+    """Small in-process cache with per-entry expiry and hit/miss counters"""
+
+    def __init__(self):
+        self.entries = {}
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+
+    def get(self, kind, key):
+        entry = self.entries.get((kind, key))
+        if entry and entry[1] > time.monotonic():
+            self.hits[kind] += 1
+            return entry[0]
+        self.misses[kind] += 1
+        return None
+
+    def set(self, kind, key, value, ttl):
+        self.entries[(kind, key)] = (value, time.monotonic() + ttl)
+
+    def invalidate(self, kind, key=None):
+        """Drop one entry, or every entry of a kind when key is None"""
+        if key is not None:
+            self.entries.pop((kind, key), None)
+            return
+        for entry_key in [k for k in self.entries if k[0] == kind]:
+            del self.entries[entry_key]
+
+    def stats(self):
+        kinds = sorted(set(self.hits) | set(self.misses))
+        sizes = defaultdict(int)
+        for kind, _ in self.entries:
+            sizes[kind] += 1
+        return [(kind, self.hits[kind], self.misses[kind], sizes[kind]) for kind in kinds]
+
+class Histogram:
+    """Latency histogram over LATENCY_BUCKETS_MS, the last bucket is open-ended"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms):
+        self.buckets[next((i for i, b in enumerate(LATENCY_BUCKETS_MS) if ms <= b), -1)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile"""
+        rank = p / 100 * self.count
+        seen = 0
+        for bound, n in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+class Metrics:
+    """Command and RPC latency, RPC counts, bytes, cache hits and loop lag"""
+
+    def __init__(self, trace_file=None):
+        self.command_name = contextvars.ContextVar('command', default='idle')
+        self.commands = defaultdict(Histogram)
+        self.rpc_latency = defaultdict(Histogram)
+        self.rpc_counts = defaultdict(Counter)
+        self.bytes = defaultdict(lambda: [0, 0])
+        self.caches = defaultdict(lambda: [0, 0])
+        self.lag = Histogram()
+        self.trace_file = trace_file
+        self.trace = None
+
+    def record(self, **fields):
+        """Append one event to the JSONL trace if one is configured"""
+        if not self.trace_file:
+            return
+        try:
+            if self.trace is None:
+                self.trace = open(self.trace_file, 'a', encoding='utf-8')
+            fields['ts'] = round(time.time(), 3)
+            self.trace.write(json.dumps(fields, ensure_ascii=False) + '\n')
+            self.trace.flush()
+        except OSError:
+            self.trace_file = None
+
+    @contextmanager
+    def command(self, name):
+        """Time a command; RPCs from it and the tasks it spawns count towards it"""
+        token = self.command_name.set(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            ms = (time.perf_counter() - started) * 1000
+            self.command_name.reset(token)
+            self.commands[name].observe(ms)
+            self.record(kind='command', name=name, ms=round(ms, 2))
+
+    def rpc(self, request, seconds, result=None):
+        command = self.command_name.get()
+        ms = seconds * 1000
+        requests = request if isinstance(request, list) else [request]
+        sent = 0
+        for r in requests:
+            method = type(r).__name__
+            self.rpc_counts[command][method] += 1
+            self.rpc_latency[method].observe(ms)
+            # Only file parts count as sent data; they carry it in .bytes
+            if isinstance(getattr(r, 'bytes', None), bytes):
+                sent += len(r.bytes)
+        received = len(result.bytes) if isinstance(getattr(result, 'bytes', None), bytes) else 0
+        self.bytes[command][0] += sent
+        self.bytes[command][1] += received
+        if self.trace_file:
+            # Serializing every request again is only worth it for the trace
+            self.record(kind='rpc', command=command, method=','.join(type(r).__name__ for r in requests),
+                        ms=round(ms, 2), sent=sent, received=received,
+                        size=sum(len(bytes(r)) for r in requests))
+
+    def cache(self, kind, hit):
+        self.caches[kind][0 if hit else 1] += 1
+
+    def loop_lag(self, seconds):
+        ms = seconds * 1000
+        self.lag.observe(ms)
+        if ms >= LATENCY_BUCKETS_MS[4]:
+            self.record(kind='lag', ms=round(ms, 2))
+
+    def instrument(self, client):
+        """Time every request the client sends, including file transfers"""
+        call = client._call
+
+        async def timed_call(sender, request, *args, **kwargs):
+            started = time.perf_counter()
+            result = None
+            try:
+                result = await call(sender, request, *args, **kwargs)
+                return result
+            finally:
+                self.rpc(request, time.perf_counter() - started, result)
+
+        # Every high-level Telethon method ends up in _call, downloads included
+        client._call = timed_call
+        return client
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def wait_time(self):
+        """Seconds until a token is available, refilling first"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+class RequestScheduler:
+    """Per-method rate limits, FloodWait retries and priority lanes for every request"""
+
+    def __init__(self, limits=REQUEST_LIMITS, max_wait=FLOOD_WAIT_MAX, on_wait=None):
+        self.limits = limits
+        self.max_wait = max_wait
+        self.on_wait = on_wait
+        self.buckets = {}
+        self.blocked_until = defaultdict(float)
+        self.current_lane = contextvars.ContextVar('lane', default=INTERACTIVE)
+        self.background_slots = asyncio.Semaphore(BACKGROUND_CONCURRENCY)
+        self.waiting = Counter()
+        self.in_flight = 0
+        self.flood_waits = 0
+
+    @contextmanager
+    def lane(self, lane):
+        """Run the requests of the wrapped block in the given lane"""
+        token = self.current_lane.set(lane)
+        try:
+            yield
+        finally:
+            self.current_lane.reset(token)
+
+    def bucket(self, method):
+        if method not in self.buckets:
+            self.buckets[method] = TokenBucket(*self.limits.get(method, self.limits['*']))
+        return self.buckets[method]
+
+    async def acquire(self, method, lane):
+        """Wait for a token of this method, letting interactive requests for it go first"""
+        bucket = self.bucket(method)
+        self.waiting[lane, method] += 1
+        try:
+            while True:
+                delay = max(self.blocked_until[method] - time.monotonic(), bucket.wait_time())
+                if lane == BACKGROUND and self.waiting[INTERACTIVE, method]:
+                    delay = max(delay, SCHEDULER_TICK)
+                if delay <= 0:
+                    bucket.take()
+                    return
+                await asyncio.sleep(delay)
+        finally:
+            self.waiting[lane, method] -= 1
+
+    def depth(self):
+        """Requests queued per lane and currently on the wire"""
+        queued = [0, 0]
+        for (lane, _), n in self.waiting.items():
+            queued[lane] += n
+        return {'interactive': queued[INTERACTIVE], 'background': queued[BACKGROUND], 'in flight': self.in_flight}
+
+    def attach(self, client):
+        """Route every request of the client through the scheduler"""
+        call = client._call
+
+        async def scheduled_call(sender, request, *args, **kwargs):
+            method = type(request[0] if isinstance(request, list) else request).__name__
+            if method in FILE_REQUESTS:
+                return await call(sender, request, *args, **kwargs)
+            lane = self.current_lane.get()
+            async with self.background_slots if lane == BACKGROUND else nullcontext():
+                while True:
+                    await self.acquire(method, lane)
+                    self.in_flight += 1
+                    try:
+                        return await call(sender, request, *args, **kwargs)
+                    except errors.FloodWaitError as e:
+                        # Hold every request of this method until Telegram allows it again
+                        self.flood_waits += 1
+                        self.blocked_until[method] = time.monotonic() + e.seconds
+                        retry = e.seconds <= self.max_wait
+                        if self.on_wait:
+                            self.on_wait(method, e.seconds, lane, retry)
+                        if not retry:
+                            raise
+                    finally:
+                        self.in_flight -= 1
+
+        client._call = scheduled_call
+        return client
+
+class DisplayIndex:
+    """Two-way map between display numbers, message ids and media numbers"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.msg_ids = []
+        self.numbers = {}
+        self.media_ids = []
+        self.media_numbers = {}
+
+    def add(self, msg_id, has_media=False):
+        """Number a message on first sight and return its display number"""
+        num = self.numbers.get(msg_id)
+        if num is None:
+            self.msg_ids.append(msg_id)
+            num = self.numbers[msg_id] = len(self.msg_ids)
+        if has_media and msg_id not in self.media_numbers:
+            self.media_ids.append(msg_id)
+            self.media_numbers[msg_id] = len(self.media_ids)
+        return num
+
+    def remove(self, msg_id):
+        """Forget a message without renumbering the others"""
+        num = self.numbers.pop(msg_id, None)
+        if num is not None:
+            self.msg_ids[num - 1] = None
+        media_num = self.media_numbers.pop(msg_id, None)
+        if media_num is not None:
+            self.media_ids[media_num - 1] = None
+
+    def msg_id(self, num):
+        """Message id for a display number, or None"""
+        return self.msg_ids[num - 1] if 0 < num <= len(self.msg_ids) else None
+
+    def media_msg_id(self, num):
+        """Message id for a media number, or None"""
+        return self.media_ids[num - 1] if 0 < num <= len(self.media_ids) else None
+
+    def number(self, msg_id):
+        return self.numbers.get(msg_id)
+
+    def media_number(self, msg_id):
+        return self.media_numbers.get(msg_id)
+
+    def __len__(self):
+        return len(self.msg_ids)
+
 class TelegramCLI:
     def __init__(self):
-        self.client = TelegramClient(SESSION_NAME, int(API_ID), API_HASH, flood_sleep_threshold=0)
+        self._client = None
+        self._downloads = None
         self.current_chat = None
         self.dialogs = []
+        self.dialogs_task = None
+        self.pending_dialogs = None
+        self.dialogs_synced = False
+        self.dialogs_dirty = False
+        self.dialogs_save_task = None
         self.message_cache = defaultdict(dict)
-        self.message_list = []
-        self.media_list = []
-        self.image_counter = 0
+        self._message_store = None
+        self.index = DisplayIndex()
+        self.history_top = None
+        self.history_bottom = None
+        self.reconcile_task = None
+        self.prefetch_task = None
+        self.prefetch_budget = int(self.get_config('prefetch_requests', PREFETCH_BUDGET))
+        self.busy = False
+        self.last_activity = time.monotonic()
         self.running = True
-        self.message_read_status = {}
-        self.display_counter = 0
-        self.update_task = None
+        self.interactive = False
+        self.read_outbox_max = {}
+        self.meta_cache = TTLCache()
+        self.render_cache = OrderedDict()
+        self.metrics = Metrics(self.get_config('trace_file'))
+        self.scheduler = RequestScheduler(max_wait=int(self.get_config('flood_wait_max', FLOOD_WAIT_MAX)),
+                                          on_wait=self.on_flood_wait)
+        self.lag_task = None
+        self.uploads = {}
+        # Parallel connections per large file, for downloads and uploads alike
+        self.file_connections = int(self.get_config('large_file_connections', LARGE_FILE_CONNECTIONS))
+        self.file_hashes = {}
         self.language = 'en'
         self.theme = 'dark'
         self.drafts = self.load_drafts()
-        self.folders = {}
+        self.drafts_flushed = json.dumps(self.drafts, ensure_ascii=False)
+        self.drafts_dirty = False
+        self.drafts_deadline = 0
+        self.drafts_task = None
+        # Guards drafts.json.tmp against a cancelled writer still running in the executor
+        self.drafts_lock = threading.Lock()
+        self.drafts_latest = self.drafts_flushed
+        self.folders = None
+        self.folder_rows = {}
+        self.folder_iters = {}
         self.current_folder = None
         self.console = Console()
         self.load_theme_from_config()
-        self.load_message_cache()
+
+    @property
+    def client(self):
+        """Telegram client, created on first use so local commands never need it"""
+        if self._client is None:
+            api_id, api_hash = get_or_prompt_api_keys()
+            # Telethon never sleeps on FloodWait itself, the scheduler retries instead
+            self._client = self.scheduler.attach(self.metrics.instrument(
+                telethon.TelegramClient(SESSION_NAME, int(api_id), api_hash, flood_sleep_threshold=0)))
+        return self._client
+
+    @property
+    def message_store(self):
+        """Message database, opened on first use so local commands never touch the disk"""
+        if self._message_store is None:
+            self._message_store = MessageStore()
+        return self._message_store
+
+    @property
+    def downloads(self):
+        if self._downloads is None:
+            self._downloads = DownloadManager(
+                self.client,
+                int(self.get_config('download_workers', DOWNLOAD_WORKERS)),
+                on_finish=self.on_download_finished,
+                large_threshold=int(float(self.get_config('large_file_threshold_mb', LARGE_FILE_THRESHOLD_MB)) * 1048576),
+                connections=self.file_connections,
+                media_store=MediaStore(),
+            )
+        return self._downloads
 
     def load_theme_from_config(self):
         """Load theme from config file"""
@@ -173,6 +1186,16 @@ class TelegramCLI:
             except:
                 pass
 
+    def get_config(self, key, default=None):
+        """Read a single setting from config file"""
+        if os.path.exists(CONFIG_FILE):
+            try:
+                with open(CONFIG_FILE, 'r') as f:
+                    return json.load(f).get(key, default)
+            except:
+                pass
+        return default
+
     def save_theme_to_config(self):
         """Save theme to config file"""
         config = {'theme': self.theme}
@@ -202,12 +1225,59 @@ class TelegramCLI:
         return {}
 
     def save_drafts(self):
-        """Save drafts to file"""
+        """Schedule a debounced background write of drafts"""
+        self.drafts_dirty = True
+        self.drafts_deadline = time.monotonic() + DRAFT_FLUSH_DELAY
         try:
-            with open(DRAFTS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.drafts, f, ensure_ascii=False, indent=2)
-        except:
-            pass
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush_drafts()
+            return
+        if self.drafts_task is None or self.drafts_task.done():
+            self.drafts_task = loop.create_task(self.drafts_writer())
+
+    async def drafts_writer(self):
+        """Wait until drafts stop changing, then write them once"""
+        # Changes made while a write is in flight are picked up by the next round
+        while self.drafts_dirty:
+            while (delay := self.drafts_deadline - time.monotonic()) > 0:
+                await asyncio.sleep(delay)
+            data = self.pending_drafts_data()
+            if data is not None:
+                await asyncio.get_running_loop().run_in_executor(None, self.write_drafts, data)
+
+    def pending_drafts_data(self):
+        """Serialized drafts if they differ from what is on disk"""
+        if not self.drafts_dirty:
+            return None
+        self.drafts_dirty = False
+        data = self.drafts_latest = json.dumps(self.drafts, ensure_ascii=False)
+        return None if data == self.drafts_flushed else data
+
+    def write_drafts(self, data):
+        """Atomically replace the drafts file"""
+        tmp_file = f"{DRAFTS_FILE}.tmp"
+        with self.drafts_lock:
+            # A newer snapshot was taken since this one, writing it would go back in time
+            if data is not self.drafts_latest:
+                return
+            try:
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_file, DRAFTS_FILE)
+                self.drafts_flushed = data
+            except:
+                pass
+
+    def flush_drafts(self):
+        """Write pending drafts right now"""
+        if self.drafts_task and not self.drafts_task.done():
+            self.drafts_task.cancel()
+        data = self.pending_drafts_data()
+        if data is not None:
+            self.write_drafts(data)
 
     def save_draft(self, chat_id, text):
         """Save draft for current chat"""
@@ -224,28 +1294,186 @@ class TelegramCLI:
             del self.drafts[str(chat_id)]
             self.save_drafts()
 
-    def load_message_cache(self):
-        """Load message cache from file"""
-        if os.path.exists(MESSAGE_CACHE_FILE):
-            try:
-                with open(MESSAGE_CACHE_FILE, 'rb') as f:
-                    cache_data = pickle.load(f)
-                    self.message_cache = cache_data.get('messages', defaultdict(dict))
-                    self.console.print(f"[green]✓[/green] Message cache loaded")
-            except:
-                pass
+    def cached_messages(self, chat_id, msg_ids):
+        """Messages of a chat by id from memory, then from disk; misses are left out"""
+        cached = self.message_cache[chat_id]
+        missing = [i for i in msg_ids if i not in cached]
+        if missing:
+            cached.update(self.message_store.load_chat(chat_id, self.client, ids=missing))
+        return {i: cached[i] for i in msg_ids if i in cached}
+
+    def cache_message(self, msg):
+        """Remember a message of the current chat in memory and on disk"""
+        self.message_cache[self.current_chat.id][msg.id] = msg
+        self.message_store.upsert(self.current_chat.id, [msg])
+        self.index.add(msg.id, bool(msg.media))
+        # Saved Messages puts a plain User in current_chat rather than a dialog row
+        self.track_message(self.current_chat.id, msg, getattr(self.current_chat, 'entity', self.current_chat))
+
+    def track_message(self, chat_id, msg, chat=None):
+        """Keep unread count, preview and position of a dialog current from a message"""
+        order = self.pending_dialogs
+        if order is None:
+            # Built once, later updates only touch their own row
+            rows = self.dialogs if self.current_folder is None else self.load_cache()
+            order = self.pending_dialogs = OrderedDict((d.id, d) for d in rows)
+        row = order.get(chat_id)
+        if row is None:
+            if chat is None:
+                return
+            row = order[chat_id] = CachedDialog(chat_id, utils.get_display_name(chat), chat, utils.get_input_peer(chat))
 
-    def save_message_cache(self):
-        """Save message cache to file"""
+        if msg.id < row.top_message:
+            return
+        row.preview = message_preview(msg)
+        if msg.id > row.top_message:
+            row.top_message = msg.id
+            row.unread_count = 0 if msg.out else row.unread_count + 1
+            # Newest first, applied the next time the list is shown like a refresh
+            order.move_to_end(chat_id, last=False)
+        self.save_dialogs_later()
+        return row
+
+    def save_dialogs_later(self):
+        """Coalesce dialog cache writes from bursts of updates"""
+        self.dialogs_dirty = True
         try:
-            cache_data = {
-                'messages': dict(self.message_cache),
-                'timestamp': time.time()
-            }
-            with open(MESSAGE_CACHE_FILE, 'wb') as f:
-                pickle.dump(cache_data, f)
-        except:
-            pass
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush_dialogs()
+            return
+        if self.dialogs_save_task is None or self.dialogs_save_task.done():
+            self.dialogs_save_task = loop.create_task(self.dialogs_writer())
+
+    async def dialogs_writer(self):
+        await asyncio.sleep(DIALOG_FLUSH_DELAY)
+        self.flush_dialogs()
+
+    def flush_dialogs(self):
+        """Write the tracked dialog list to the cache right now"""
+        if not self.dialogs_dirty:
+            return
+        self.dialogs_dirty = False
+        if self.pending_dialogs is not None:
+            self.save_cache(self.pending_dialogs.values())
+        elif self.current_folder is None:
+            self.save_cache()
+
+    def forget_messages(self, chat_id, msg_ids):
+        """Drop deleted messages from memory, disk and the display index"""
+        if chat_id is None:
+            chats = [c for c in self.message_cache if c > CHANNEL_ID_LIMIT]
+            self.message_store.delete_unscoped(msg_ids)
+        else:
+            chats = [chat_id]
+            self.message_store.delete(chat_id, msg_ids)
+        for c in chats:
+            cached = self.message_cache.get(c, {})
+            for msg_id in msg_ids:
+                cached.pop(msg_id, None)
+        if self.current_chat and self.current_chat.id in chats:
+            for msg_id in msg_ids:
+                self.index.remove(msg_id)
+
+    async def get_me(self):
+        """Get own user, cached"""
+        me = self.meta_cache.get('me', None)
+        if me is None:
+            me = await self.client.get_me()
+            self.meta_cache.set('me', None, me, ME_TTL)
+            self.meta_cache.set('entity', me.id, me, ME_TTL)
+        return me
+
+    async def get_entity(self, peer):
+        """Get entity by id, username or dialog, cached"""
+        if getattr(peer, 'entity', None) is not None:
+            return peer.entity
+        key = peer.lower() if isinstance(peer, str) else getattr(peer, 'id', peer)
+        entity = self.meta_cache.get('entity', key)
+        if entity is None:
+            entity = await self.client.get_entity(peer)
+            self.meta_cache.set('entity', key, entity, ENTITY_TTL)
+        return entity
+
+    async def get_my_permissions(self, chat):
+        """Get own permissions in a chat, cached"""
+        perms = self.meta_cache.get('perms', chat.id)
+        if perms is None:
+            perms = await self.client.get_permissions(chat, 'me')
+            self.meta_cache.set('perms', chat.id, perms, PERMISSIONS_TTL)
+        return perms
+
+    def on_flood_wait(self, method, seconds, lane, retry):
+        self.metrics.record(kind='flood_wait', method=method, seconds=seconds, lane=lane, retry=retry)
+        if lane == INTERACTIVE:
+            action = "retrying" if retry else "giving up"
+            self.console.print(f"[yellow]⏳ flood wait {seconds}s on {method}, {action}[/yellow]")
+
+    async def watch_loop_lag(self):
+        """Measure how late the event loop wakes up a sleeping task"""
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            self.metrics.loop_lag(max(time.perf_counter() - started - LOOP_LAG_INTERVAL, 0))
+
+    def show_stats(self):
+        m = self.metrics
+        table = Table(show_header=True, header_style="bold magenta", box=None, title="commands")
+        for column in ("command", "n", "p50 ms", "p95 ms", "max ms", "rpc", "sent", "received"):
+            table.add_column(column, justify="left" if column == "command" else "right")
+        for name in sorted(set(m.commands) | set(m.rpc_counts)):
+            h = m.commands.get(name) or Histogram()
+            sent, received = m.bytes[name]
+            table.add_row(name, str(h.count), f"{h.percentile(50):.0f}", f"{h.percentile(95):.0f}", f"{h.max:.0f}",
+                          str(sum(m.rpc_counts[name].values())), format_bytes(sent), format_bytes(received))
+        self.console.print(table)
+
+        table = Table(show_header=True, header_style="bold magenta", box=None, title="rpc")
+        for column in ("method", "n", "p50 ms", "p95 ms", "max ms"):
+            table.add_column(column, justify="left" if column == "method" else "right")
+        for method, h in sorted(m.rpc_latency.items(), key=lambda p: -p[1].total):
+            table.add_row(method, str(h.count), f"{h.percentile(50):.0f}", f"{h.percentile(95):.0f}", f"{h.max:.0f}")
+        self.console.print(table)
+
+        table = Table(show_header=True, header_style="bold magenta", box=None, title="caches")
+        for column in ("cache", "hits", "misses", "hit rate"):
+            table.add_column(column, justify="left" if column == "cache" else "right")
+        rows = [(kind, hits, misses) for kind, hits, misses, _ in self.meta_cache.stats()]
+        rows += [(kind, hits, misses) for kind, (hits, misses) in sorted(m.caches.items())]
+        for kind, hits, misses in rows:
+            rate = f"{hits / (hits + misses):.0%}" if hits + misses else "-"
+            table.add_row(kind, str(hits), str(misses), rate)
+        self.console.print(table)
+
+        depth = ', '.join(f"{lane} {n}" for lane, n in self.scheduler.depth().items())
+        self.console.print(f"[dim]queue: {depth}; flood waits: {self.scheduler.flood_waits}[/dim]")
+        lag = m.lag
+        self.console.print(f"[dim]loop lag: p50 {lag.percentile(50):.0f} ms, p95 {lag.percentile(95):.0f} ms, "
+                           f"max {lag.max:.0f} ms over {lag.count} samples[/dim]")
+        if m.trace_file:
+            self.console.print(f"[dim]trace: {m.trace_file}[/dim]")
+        print()
+
+    def show_cache_stats(self):
+        table = Table(show_header=True, header_style="bold magenta", box=None)
+        table.add_column("cache")
+        table.add_column("hits", justify="right")
+        table.add_column("misses", justify="right")
+        table.add_column("size", justify="right")
+        for kind, hits, misses, size in self.meta_cache.stats():
+            table.add_row(kind, str(hits), str(misses), str(size))
+        self.console.print(table)
+        print()
+
+    async def get_message(self, msg_id):
+        """Resolve a message of the current chat from cache, fetching only on a miss"""
+        msg = self.cached_messages(self.current_chat.id, [msg_id]).get(msg_id)
+        self.metrics.cache('message', msg is not None)
+        if msg is None:
+            msg = await self.client.get_messages(self.current_chat, ids=msg_id)
+            if msg:
+                self.cache_message(msg)
+        return msg
 
     def t(self, key):
         return LANGUAGES[self.language].get(key, key)
@@ -281,18 +1509,25 @@ class TelegramCLI:
         return width
 
     def load_cache(self):
+        dialogs = []
         if os.path.exists(CACHE_FILE):
             try:
                 with open(CACHE_FILE, 'rb') as f:
-                    return pickle.load(f)
+                    data = pickle.load(f)
+                for row in data:
+                    try:
+                        dialogs.append(CachedDialog.from_cache(row))
+                    except:
+                        continue
             except:
                 return []
-        return []
+        return dialogs
 
-    def save_cache(self):
+    def save_cache(self, dialogs=None):
+        dialogs = self.dialogs if dialogs is None else dialogs
         try:
             with open(CACHE_FILE, 'wb') as f:
-                pickle.dump(self.dialogs, f)
+                pickle.dump([d.to_cache() for d in dialogs], f)
         except:
             pass
 
@@ -324,32 +1559,71 @@ class TelegramCLI:
                 return ('document', ext)
         return ('media', '')
 
-    def format_media_label(self, msg):
-        media_info = self.get_media_type(msg)
+    def format_media_label(self, media_info):
         if not media_info:
-            return ""
+            return Text()
         media_type, ext = media_info
-        primary = self.get_theme_color('primary')
-        labels = {'img': 'IMG', 'sticker': 'STK', 'video': 'VID', 'audio': 'AUD', 'document': 'DOC', 'gif': 'GIF', 'voice': 'VCE'}
-        label = labels.get(media_type, media_type.upper())
-        return f"{primary}[{label}{ext}]{C.RESET}"
-
-    def parse_markdown(self, text):
-        """Convert Telegram/Markdown formatting to Rich markup"""
-        # Bold **text**
-        text = re.sub(r'\*\*(.+?)\*\*', r'[bold]\1[/bold]', text)
-        # Italic *text* or _text_
-        text = re.sub(r'(?<!\*)\*(?!\*)(.+?)(?<!\*)\*(?!\*)', r'[italic]\1[/italic]', text)
-        text = re.sub(r'(?<!_)_(?!_)(.+?)(?<!_)_(?!_)', r'[italic]\1[/italic]', text)
-        # Code `text`
-        text = re.sub(r'`(.+?)`', r'[reverse]\1[/reverse]', text)
-        # Strikethrough ~~text~~
-        text = re.sub(r'~~(.+?)~~', r'[strike]\1[/strike]', text)
-        # Underline __text__
-        text = re.sub(r'__(.+?)__', r'[underline]\1[/underline]', text)
-        # Spoiler ||text||
-        text = re.sub(r'\|\|(.+?)\|\|', r'[dim]\1[/dim]', text)
-        return text
+        label = MEDIA_LABELS.get(media_type, media_type.upper())
+        return Text(f"[{label}{ext}]", style=self.get_theme_color('rich'))
+
+    def render_text(self, text):
+        """Single-pass markdown tokenizer for text that has no entities"""
+        out = Text()
+        pos = 0
+        for match in MARKDOWN_RE.finditer(text):
+            out.append(text[pos:match.start()])
+            group = match.lastindex
+            out.append(match.group(group), style=MARKDOWN_STYLES[group - 1])
+            pos = match.end()
+        out.append(text[pos:])
+        return out
+
+    def render_entities(self, text, entities):
+        """Build styled text straight from Telegram message entities"""
+        # Entity offsets count UTF-16 code units, which add_surrogate makes indexable
+        text = helpers.add_surrogate(text)
+        styled = []
+        cuts = {0, len(text)}
+        for e in entities:
+            style = ENTITY_STYLES.get(type(e).__name__)
+            if isinstance(e, types.MessageEntityTextUrl):
+                style = f"underline link {e.url}"
+            if style:
+                styled.append((e.offset, e.offset + e.length, style))
+                cuts.update((e.offset, e.offset + e.length))
+        out = Text()
+        cuts = sorted(c for c in cuts if 0 <= c <= len(text))
+        for start, end in zip(cuts, cuts[1:]):
+            style = ' '.join(st for a, b, st in styled if a <= start and end <= b)
+            out.append(helpers.del_surrogate(text[start:end]), style=style or None)
+        return out
+
+    def render_content(self, msg, limit):
+        """Message body, edit mark and media label as Text, cached per edit"""
+        edit_date = getattr(msg, 'edit_date', None)
+        key = (msg.chat_id, msg.id, edit_date and edit_date.timestamp(), limit, self.theme)
+        content = self.render_cache.get(key)
+        self.metrics.cache('render', content is not None)
+        if content is not None:
+            self.render_cache.move_to_end(key)
+            return content
+
+        content = Text()
+        if edit_date:
+            content.append("[edited] ", style="dim")
+        body = getattr(msg, 'message', None)
+        if body:
+            entities = getattr(msg, 'entities', None)
+            rendered = self.render_entities(body, entities) if entities else self.render_text(body)
+            content.append_text(rendered[:limit])
+            content.append(" ")
+        if msg.media:
+            content.append_text(self.format_media_label(self.get_media_type(msg)))
+
+        self.render_cache[key] = content
+        if len(self.render_cache) > RENDER_CACHE_SIZE:
+            self.render_cache.popitem(last=False)
+        return content
 
     def calculate_speed(self, text_length):
         if text_length <= 10:
@@ -368,100 +1642,238 @@ class TelegramCLI:
         else:
             self.console.print(f"[bold magenta]+[/bold magenta] First login")
         await self.client.start()
-        me = await self.client.get_me()
+        if self.lag_task is None:
+            self.lag_task = asyncio.create_task(self.watch_loop_lag())
+        me = await self.get_me()
         self.console.print(f"[bold magenta]✓[/bold magenta] {self.t('logged_in')}: {me.first_name}\n")
 
-        # Load folders
-        await self.load_folders()
-
         @self.client.on(events.NewMessage())
         async def handle_new_message(event):
             await self.on_new_message(event)
 
+        @self.client.on(events.MessageRead(inbox=False))
+        async def handle_message_read(event):
+            await self.on_message_read(event)
+
+        @self.client.on(events.MessageRead(inbox=True))
+        async def handle_inbox_read(event):
+            await self.on_message_read(event)
+
+        @self.client.on(events.MessageEdited())
+        async def handle_message_edited(event):
+            await self.on_message_edited(event)
+
+        @self.client.on(events.MessageDeleted())
+        async def handle_message_deleted(event):
+            await self.on_message_deleted(event)
+
+        @self.client.on(events.ChatAction())
+        async def handle_chat_action(event):
+            # Membership or admin changes may change what we are allowed to do
+            self.meta_cache.invalidate('perms', event.chat_id)
+            self.meta_cache.invalidate('entity', event.chat_id)
+
     async def load_folders(self):
-        """Load Telegram folders"""
+        """Load Telegram folders (dialog filters) on first use"""
+        if self.folders is None:
+            result = await self.client(functions.messages.GetDialogFiltersRequest())
+            filters = getattr(result, 'filters', result)
+            self.folders = [f for f in filters if not isinstance(f, types.DialogFilterDefault)]
+        return self.folders
+
+    def folder_title(self, folder):
+        return getattr(folder.title, 'text', folder.title)
+
+    def folder_matches(self, folder, d):
+        """Check a dialog against the rule flags of a folder"""
+        entity = d.entity
+        if isinstance(entity, types.User):
+            if entity.bot:
+                included = folder.bots
+            elif entity.contact:
+                included = folder.contacts
+            else:
+                included = folder.non_contacts
+        elif isinstance(entity, types.Channel) and entity.broadcast:
+            included = folder.broadcasts
+        else:
+            included = folder.groups
+        if not included:
+            return False
+        if folder.exclude_read and d.unread_count == 0:
+            return False
+        if folder.exclude_archived and d.archived:
+            return False
+        if folder.exclude_muted:
+            mute_until = getattr(d.dialog.notify_settings, 'mute_until', None)
+            if mute_until and mute_until.timestamp() > time.time():
+                return False
+        return True
+
+    async def iter_folder(self, folder):
+        """Yield folder dialogs page by page, explicit peers first"""
+        seen = set()
+        peers = list(folder.pinned_peers) + list(folder.include_peers)
+        for start in range(0, len(peers), FOLDER_PAGE_SIZE):
+            page = peers[start:start + FOLDER_PAGE_SIZE]
+            result = await self.client(functions.messages.GetPeerDialogsRequest(peers=[types.InputDialogPeer(p) for p in page]))
+            entities = {utils.get_peer_id(e): e for e in result.users + result.chats}
+            for dlg in result.dialogs:
+                entity = entities.get(utils.get_peer_id(dlg.peer))
+                if entity is None:
+                    continue
+                seen.add(utils.get_peer_id(entity))
+                yield CachedDialog(utils.get_peer_id(entity), utils.get_display_name(entity), entity,
+                                   utils.get_input_peer(entity), dlg.unread_count, dlg.top_message,
+                                   dlg.read_outbox_max_id)
+
+        rules = ('contacts', 'non_contacts', 'groups', 'broadcasts', 'bots')
+        if not any(getattr(folder, r, None) for r in rules):
+            return
+        excluded = set()
+        for p in getattr(folder, 'exclude_peers', []):
+            try:
+                excluded.add(utils.get_peer_id(p))
+            except:
+                continue
+        async for d in self.client.iter_dialogs():
+            if d.id in seen or d.id in excluded or not self.folder_matches(folder, d):
+                continue
+            yield CachedDialog.from_dialog(d)
+
+    async def folder_page(self, num, page):
+        """Get one page of a folder, fetching only as far as needed"""
+        folder = self.folders[num]
+        rows = self.folder_rows.setdefault(folder.id, [])
+        if folder.id not in self.folder_iters:
+            self.folder_iters[folder.id] = self.iter_folder(folder)
+        it = self.folder_iters[folder.id]
+        while it is not None and len(rows) < page * FOLDER_PAGE_SIZE:
+            try:
+                rows.append(await it.__anext__())
+            except StopAsyncIteration:
+                self.folder_iters[folder.id] = it = None
+        return rows
+
+    async def list_folders(self):
         try:
-            dialogs = await self.client.get_dialogs()
-            # Telegram folders are accessible via dialog filters
-            self.folders = {'all': dialogs}
+            folders = await self.load_folders()
         except:
-            pass
+            self.console.print(f"[red]{self.t('error')}[/red]")
+            return
+        if not folders:
+            self.console.print(f"[dim]no folders[/dim]")
+            return
+        for idx, folder in enumerate(folders, 1):
+            self.console.print(f" {idx:2} {self.folder_title(folder)}")
+        print()
 
-    async def update_read_status_loop(self):
-        while self.running:
-            if self.current_chat:
-                try:
-                    async for msg in self.client.iter_messages(self.current_chat, limit=30):
-                        if msg.out:
-                            key = f"{self.current_chat.id}_{msg.id}"
-                            is_read = hasattr(msg, 'read_date') and msg.read_date is not None
-                            self.message_read_status[key] = is_read
-
-                            # Track who read in groups
-                            if hasattr(msg, 'reactions') and msg.reactions:
-                                self.message_read_status[f"{key}_readers"] = msg.reactions
-                except:
-                    pass
-            await asyncio.sleep(3)
+    async def show_folder(self, num, page=1):
+        try:
+            num, page = int(num) - 1, max(int(page), 1)
+            folders = await self.load_folders()
+            if num < 0 or num >= len(folders):
+                self.console.print(f"[dim]invalid folder[/dim]")
+                return
+            rows = await self.folder_page(num, page)
+        except:
+            self.console.print(f"[red]{self.t('error')}[/red]")
+            return
 
-    def animate_send(self):
-        frames = ['⠋', '⠙', '⠹', '⠸', '⠼', '⠴']
-        primary = self.get_theme_color('primary')
-        for i in range(3):
-            sys.stdout.write(f"\r{primary}{frames[i % len(frames)]}{C.RESET}")
-            sys.stdout.flush()
-            time.sleep(0.01)
-        sys.stdout.write(f"\r{C.RESET}")
-        sys.stdout.flush()
+        start = (page - 1) * FOLDER_PAGE_SIZE
+        self.current_folder = folders[num].id
+        self.dialogs = list(rows)
+        self.pending_dialogs = None
+        title = f"[bold]{self.folder_title(folders[num])}[/bold] [dim]page {page}[/dim]"
+        self.render_dialogs(enumerate(rows[start:start + FOLDER_PAGE_SIZE], start + 1), title=title)
+
+    def mark_read(self, chat_id, max_id):
+        """Move the "read up to" watermark of a chat forward"""
+        if max_id and max_id > self.read_outbox_max.get(chat_id, 0):
+            self.read_outbox_max[chat_id] = max_id
+
+    async def on_message_read(self, event):
+        if event.outbox:
+            self.mark_read(event.chat_id, event.max_id)
+            return
+        # Read on another device: clear the counter once everything is read
+        pending = self.pending_dialogs.get(event.chat_id) if self.pending_dialogs else None
+        for d in [d for d in self.dialogs if d.id == event.chat_id] + [pending]:
+            if d and event.max_id >= d.top_message and d.unread_count:
+                d.unread_count = 0
+                self.save_dialogs_later()
+
+    @contextmanager
+    def spinner(self, label=''):
+        """Show a spinner with elapsed time while the wrapped request is awaited"""
+        if not self.console.is_interactive:
+            yield lambda text: None
+            return
+        # Rich refreshes from its own thread, so the event loop is never blocked
+        progress = Progress(
+            SpinnerColumn(style="bold magenta"),
+            TextColumn("[dim]{task.description}[/dim]"),
+            TimeElapsedColumn(),
+            console=self.console,
+            transient=True,
+        )
+        with progress:
+            task = progress.add_task(label, total=None)
+            yield lambda text: progress.update(task, description=text)
+
+    @contextmanager
+    def transfer_progress(self, label=''):
+        """Progress bar with throughput, yields a telethon progress_callback"""
+        if not self.console.is_interactive:
+            yield lambda current, total: None
+            return
+        progress = Progress(
+            TextColumn("[dim]{task.description}[/dim]"),
+            BarColumn(complete_style="magenta"),
+            DownloadColumn(),
+            TransferSpeedColumn(),
+            TimeElapsedColumn(),
+            console=self.console,
+            transient=True,
+        )
+        with progress:
+            task = progress.add_task(label, total=None)
+
+            def callback(current, total):
+                progress.update(task, completed=current, total=total or None)
+
+            yield callback
 
     def get_status(self, msg):
         if msg.out:
-            key = f"{self.current_chat.id}_{msg.id}"
-            is_read = self.message_read_status.get(key, False)
-
-            # Check for group read receipts
-            readers_key = f"{key}_readers"
-            if readers_key in self.message_read_status:
-                readers = self.message_read_status[readers_key]
-                return f"{C.WHITE}✓✓[{len(readers)}]{C.RESET}"
-
-            return f"{C.WHITE}✓✓{C.RESET}" if is_read else f"{C.GRAY}✓{C.RESET}"
-        return f"{C.WHITE}•{C.RESET}"
+            is_read = msg.id <= self.read_outbox_max.get(self.current_chat.id, 0)
+            return Text("✓✓", style="bright_white") if is_read else Text("✓", style="bright_black")
+        return Text("•", style="bright_white")
 
     async def show_msg_animated(self, msg):
-        if not msg or not (msg.text or msg.media):
+        if not msg or not (getattr(msg, 'message', None) or msg.media):
             return
-        if msg.media:
-            self.image_counter += 1
-            self.media_list.append({'msg_id': msg.id, 'img_num': self.image_counter})
-        self.display_counter += 1
+        num = self.index.add(msg.id, bool(msg.media))
         sender = "You" if msg.out else (msg.sender.first_name[:10] if hasattr(msg.sender, 'first_name') else "?")
         time_str = msg.date.strftime("%H:%M")
-        status = self.get_status(msg)
-        media_label = self.format_media_label(msg) if msg.media else ""
-
-        # Remove ANSI codes from status for Rich
-        status = re.sub(r'\x1b\[[0-9;]*m', '', status)
-        
         sender_color = "bold magenta" if msg.out else "bold cyan"
         sender_prefix = "→" if msg.out else "←"
 
-        # Show edit indicator
-        edit_indicator = "[dim][edited][/dim] " if hasattr(msg, 'edit_date') and msg.edit_date else ""
-
-        if msg.text:
-            text = self.parse_markdown(msg.text[:100])
-            self.console.print(f" {self.display_counter:2} [dim]{time_str}[/dim] {status} [{sender_color}]{sender_prefix} {sender}[/{sender_color}] | {edit_indicator}{text} {media_label}")
-        else:
-            self.console.print(f" {self.display_counter:2} [dim]{time_str}[/dim] {status} [{sender_color}]{sender_prefix} {sender}[/{sender_color}] | {edit_indicator}{media_label}")
+        self.console.print(Text.assemble(
+            f" {num:2} ", (time_str, "dim"), " ", self.get_status(msg), " ",
+            (f"{sender_prefix} {sender}", sender_color), " | ", self.render_content(msg, 100),
+        ))
 
     async def on_new_message(self, event):
         if not self.current_chat or event.chat_id != self.current_chat.id:
+            # Still index it so search covers chats that are not open
+            self.message_store.upsert(event.chat_id, [event.message])
+            row = self.track_message(event.chat_id, event.message, event.chat)
+            if row and self.interactive and not event.message.out:
+                self.notify(row)
             return
         msg = event.message
-        self.message_cache[self.current_chat.id][msg.id] = msg
-        if msg.id not in self.message_list:
-            self.message_list.append(msg.id)
+        self.cache_message(msg)
 
         if not msg.out:
             sys.stdout.write("\n")
@@ -476,19 +1888,24 @@ class TelegramCLI:
 
         self.console.print(f"[bold magenta]>[/bold magenta] ", end="")
 
-    async def list_chats(self, limit=None, folder=None):
-        table = Table(show_header=True, header_style="bold magenta", box=None)
+    def notify(self, d):
+        """One-line notice about a message in a chat that is not open"""
+        self.console.print()
+        self.console.print(Text.assemble(
+            ("● ", "bold magenta"), (d.name[:24], "bold"), (f" +{d.unread_count}", "dim"), " ", (d.preview, "dim"),
+        ))
+        self.console.print(f"[bold magenta]>[/bold magenta] ", end="")
+
+    def render_dialogs(self, rows, title=None):
+        """Print (index, dialog) rows as a chat table"""
+        table = Table(show_header=True, header_style="bold magenta", box=None, title=title)
         table.add_column("#", style="dim", width=4)
         table.add_column(self.t('chats'), style="bold")
         table.add_column("Type", width=3)
         table.add_column("Unread", justify="right")
+        table.add_column("Last", style="dim", no_wrap=True, max_width=PREVIEW_LENGTH)
 
-        self.dialogs = []
-        async for d in self.client.iter_dialogs(limit=100):
-            self.dialogs.append(d)
-        self.save_cache()
-
-        for idx, d in enumerate(self.dialogs[:limit] if limit else self.dialogs, 1):
+        for idx, d in rows:
             name = d.name[:32]
             badge = self.get_type_badge(d.entity)
             unread = f"+{d.unread_count}" if d.unread_count > 0 else ""
@@ -503,12 +1920,215 @@ class TelegramCLI:
                 str(idx),
                 f"{name} {draft_indicator}",
                 clean_badge,
-                unread
+                unread,
+                Text(getattr(d, 'preview', '')),
             )
 
         self.console.print(table)
         print()
 
+    async def fetch_dialogs(self):
+        """Fetch the dialog list from Telegram"""
+        dialogs = []
+        async for d in self.client.iter_dialogs(limit=100):
+            dialogs.append(CachedDialog.from_dialog(d))
+        return dialogs
+
+    async def refresh_dialogs(self, quiet=False):
+        """Revalidate the shown dialog list in place, keeping indices stable"""
+        try:
+            with self.scheduler.lane(BACKGROUND):
+                fresh = await self.fetch_dialogs()
+        except:
+            return
+
+        for d in fresh:
+            self.mark_read(d.id, d.read_outbox_max_id)
+
+        if self.current_folder is not None:
+            # A folder is on screen, keep its indices and just store the result
+            self.pending_dialogs = None
+            self.dialogs_synced = True
+            self.save_cache(fresh)
+            return
+
+        positions = {d.id: idx for idx, d in enumerate(self.dialogs)}
+        changed = []
+        for d in fresh:
+            idx = positions.get(d.id)
+            if idx is None:
+                self.dialogs.append(d)
+                changed.append((len(self.dialogs), d))
+            elif self.dialogs[idx].changed(d):
+                self.dialogs[idx] = d
+                changed.append((idx + 1, d))
+
+        # New ordering is applied the next time the list is shown; the cache
+        # gets it now, without the chats the server no longer returns
+        self.pending_dialogs = OrderedDict((d.id, d) for d in fresh)
+        self.dialogs_synced = True
+        self.save_cache(fresh)
+        self.schedule_prefetch()
+
+        if changed and not quiet:
+            self.console.print()
+            self.render_dialogs(changed, title="[dim]updated[/dim]")
+            if self.interactive:
+                self.console.print(f"[bold magenta]>[/bold magenta] ", end="")
+
+    async def on_message_edited(self, event):
+        msg = event.message
+        if event.chat_id in self.message_cache:
+            self.message_cache[event.chat_id][msg.id] = msg
+        self.message_store.upsert(event.chat_id, [msg])
+        self.track_message(event.chat_id, msg)
+
+    async def on_message_deleted(self, event):
+        self.forget_messages(event.chat_id, event.deleted_ids)
+
+    async def list_chats(self, limit=None, folder=None):
+        if folder is not None:
+            await self.show_folder(folder)
+            return
+        limit = int(limit) if limit else None
+
+        if self.current_folder is not None:
+            self.current_folder = None
+            self.dialogs = []
+        if self.pending_dialogs is not None:
+            self.dialogs = list(self.pending_dialogs.values())
+            self.pending_dialogs = None
+        elif not self.dialogs:
+            self.dialogs = self.load_cache()
+
+        if not self.dialogs:
+            # Cold start: nothing to show until the network answers
+            self.dialogs = await self.fetch_dialogs()
+            self.dialogs_synced = True
+            self.save_cache()
+        elif not self.dialogs_synced and (not self.dialogs_task or self.dialogs_task.done()):
+            # Once fetched, updates keep the list current without refetching
+            self.dialogs_task = asyncio.create_task(self.refresh_dialogs())
+
+        rows = enumerate(self.dialogs[:limit] if limit else self.dialogs, 1)
+        self.render_dialogs(rows)
+
+    def schedule_prefetch(self):
+        """Start warming recent history of top dialogs if budget is left"""
+        if not self.interactive or self.prefetch_budget <= 0:
+            return
+        if self.prefetch_task is None or self.prefetch_task.done():
+            self.prefetch_task = asyncio.create_task(self.prefetch_history())
+
+    async def wait_idle(self):
+        """Sleep until no command has run for PREFETCH_IDLE seconds"""
+        while self.busy or time.monotonic() - self.last_activity < PREFETCH_IDLE:
+            await asyncio.sleep(PREFETCH_IDLE / 4)
+
+    def prefetch_candidates(self, dialogs):
+        """Top dialogs by unread count, then recency, whose latest page is not cached"""
+        ranked = sorted(enumerate(dialogs), key=lambda p: (-p[1].unread_count, p[0]))
+        limit = int(self.get_config('prefetch_dialogs', PREFETCH_DIALOGS))
+        for _, d in ranked[:limit]:
+            if self.current_chat and d.id == self.current_chat.id:
+                continue
+            newest, count = self.message_store.chat_stats(d.id)
+            if newest >= d.top_message and count >= min(PREFETCH_MESSAGES, d.top_message):
+                continue
+            yield d, (newest if count >= PREFETCH_MESSAGES else 0)
+
+    async def prefetch_history(self):
+        """Idle-time warm-up of the most recent pages of the top dialogs"""
+        with self.scheduler.lane(BACKGROUND):
+            await self.prefetch_pages()
+
+    async def prefetch_pages(self):
+        await self.wait_idle()
+        if self.dialogs_task is None:
+            # Rank against a fresh dialog list, it costs one request of the budget
+            self.prefetch_budget -= 1
+            self.dialogs_task = asyncio.create_task(self.refresh_dialogs(quiet=True))
+        try:
+            await self.dialogs_task
+        except:
+            return
+        dialogs = list(self.pending_dialogs.values()) if self.pending_dialogs else self.dialogs
+
+        for d, min_id in list(self.prefetch_candidates(dialogs)):
+            if self.prefetch_budget <= 0:
+                break
+            await self.wait_idle()
+            self.prefetch_budget -= 1
+            try:
+                msgs = await self.client.get_messages(d.input_entity, limit=PREFETCH_MESSAGES, min_id=min_id)
+            except errors.FloodWaitError:
+                break
+            except:
+                continue
+            self.message_store.upsert(d.id, msgs)
+            if d.id in self.message_cache:
+                self.message_cache[d.id].update((m.id, m) for m in msgs)
+
+    def show_cached_messages(self, limit):
+        """Render the newest cached page of the current chat without the network.
+
+        Returns False when nothing of the chat is cached.
+        """
+        recent = self.message_store.load_chat(self.current_chat.id, self.client, limit=limit)
+        if not recent:
+            return False
+        self.message_cache[self.current_chat.id].update(recent)
+        msgs = list(recent.values())
+        chat_name = getattr(self.current_chat, 'name', None) or 'Unknown'
+        self.console.print(Panel(f"[bold]{self.t('history')} — {str(chat_name)[:40]} · cached[/bold]", style="blue"))
+        table = self.history_table()
+        for msg in msgs:
+            try:
+                self.add_history_row(table, msg)
+            except:
+                continue
+        self.console.print(table)
+        print()
+        self.history_top, self.history_bottom = msgs[0].id, msgs[-1].id
+        return True
+
+    async def reconcile_history(self, limit):
+        """Check a page rendered from cache against the server, show what changed"""
+        chat = self.current_chat
+        try:
+            with self.scheduler.lane(BACKGROUND):
+                msgs = await self.client.get_messages(chat, limit=limit)
+        except:
+            return
+        if self.current_chat is not chat or not msgs:
+            return
+        self.message_store.upsert(chat.id, msgs)
+        cached = self.message_cache[chat.id]
+
+        # Cached messages inside the fetched window that the server no longer has
+        fetched = {m.id for m in msgs}
+        low = min(fetched)
+        gone = [i for i in cached if low <= i <= self.history_bottom and i not in fetched]
+        if gone:
+            self.forget_messages(chat.id, gone)
+
+        new = []
+        for m in reversed(msgs):
+            cached[m.id] = m
+            if self.index.number(m.id) is None:
+                new.append(m)
+        if not new:
+            return
+        table = self.history_table()
+        for msg in new:
+            try:
+                self.add_history_row(table, msg)
+            except:
+                continue
+        self.console.print(table)
+        self.history_bottom = max(self.history_bottom, new[-1].id)
+        self.console.print(f"[bold magenta]>[/bold magenta] ", end="")
+
     async def select_chat(self, idx):
         try:
             idx = int(idx) - 1
@@ -516,119 +2136,208 @@ class TelegramCLI:
                 self.current_chat = self.dialogs[idx]
                 self.console.print(f"\n[bold magenta]→[/bold magenta] {self.current_chat.name}\n")
                 self.message_cache.clear()
-                self.message_list.clear()
-                self.media_list.clear()
-                self.image_counter = 0
-                self.display_counter = 0
-                self.message_read_status.clear()
+                self.index.clear()
+                self.history_top = self.history_bottom = None
+                self.mark_read(self.current_chat.id, getattr(self.current_chat, 'read_outbox_max_id', 0))
 
                 # Show draft if exists
                 draft = self.get_draft(self.current_chat.id)
                 if draft:
                     self.console.print(f"[yellow]📝 Draft: {draft}[/yellow]\n")
 
-                await self.show_messages(15)
+                if self.show_cached_messages(15):
+                    # Prefetched or seen before: shown already, catch up in the background
+                    self.reconcile_task = asyncio.create_task(self.reconcile_history(15))
+                else:
+                    await self.show_messages(15)
                 return True
             return False
         except:
             return False
 
-    async def show_messages(self, limit=15):
+    def history_table(self):
+        table = Table(show_header=False, box=None, padding=(0, 1))
+        table.add_column("ID", style="dim", width=4)
+        table.add_column("Time", style="dim", width=6)
+        table.add_column("Status", width=4)
+        table.add_column("Sender", width=15)
+        table.add_column("Content")
+        return table
+
+    def add_history_row(self, table, msg):
+        if not (getattr(msg, 'message', None) or msg.media):
+            return
+        self.message_cache[self.current_chat.id][msg.id] = msg
+        num = self.index.add(msg.id, bool(msg.media))
+
+        sender = "You" if msg.out else (getattr(msg.sender, 'first_name', '?')[:10] if msg.sender else "?")
+        time_str = msg.date.strftime("%H:%M") if msg.date else "--:--"
+        sender_text = Text(sender or "?", style="magenta" if msg.out else "cyan")
+
+        table.add_row(str(num), time_str, self.get_status(msg), sender_text, self.render_content(msg, 80))
+
+    async def iter_history(self, limit, offset_id=0, add_offset=0, after=None):
+        """Yield a window of history oldest-first without holding it all in memory"""
+        chat = self.current_chat
+        if after is not None:
+            async for m in self.client.iter_messages(chat, reverse=True, offset_id=after, limit=limit):
+                yield m
+            return
+        if limit <= HISTORY_CHUNK:
+            msgs = [m async for m in self.client.iter_messages(chat, limit=limit, offset_id=offset_id, add_offset=add_offset)]
+            for m in reversed(msgs):
+                yield m
+            return
+        # Find the oldest message of the window, then stream forward from it
+        anchor = await self.client.get_messages(chat, limit=1, offset_id=offset_id, add_offset=add_offset + limit - 1)
+        start = anchor[0].id - 1 if anchor else 0
+        async for m in self.client.iter_messages(chat, reverse=True, offset_id=start, max_id=offset_id, limit=limit):
+            yield m
+
+    def parse_history_args(self, args):
+        """Parse "[n] [--before|--after] [--page k]" for msg"""
+        opts = {'limit': 15}
+        parts = iter((args or '').split())
+        for part in parts:
+            if part.isdigit():
+                opts['limit'] = int(part)
+            elif part in ('--before', '--after'):
+                opts[part[2:]] = True
+            elif part == '--page':
+                page = next(parts, '')
+                if page.isdigit():
+                    opts['page'] = int(page)
+        return opts
+
+    async def show_messages(self, limit=15, before=False, after=False, page=None):
         if not self.current_chat:
             self.console.print(f"[yellow]{self.t('no_chat')}[/yellow]")
             return
 
         chat_name = getattr(self.current_chat, 'name', None) or getattr(self.current_chat, 'title', 'Unknown')
-        self.console.print(Panel(f"[bold]{self.t('history')} — {str(chat_name)[:40]}[/bold]", style="blue"))
-        
-        msgs = []
+        window = {}
+        where = ""
+        if after and self.history_bottom:
+            window['after'] = self.history_bottom
+            where = " · newer"
+        elif before and self.history_top:
+            window['offset_id'] = self.history_top
+            where = " · older"
+        elif page and page > 1:
+            window['add_offset'] = (page - 1) * limit
+            where = f" · page {page}"
+        self.console.print(Panel(f"[bold]{self.t('history')} — {str(chat_name)[:40]}{where}[/bold]", style="blue"))
+
+        # Render and persist chunk by chunk as messages arrive
+        chunk = []
+        shown = []
+
+        def flush():
+            table = self.history_table()
+            for msg in chunk:
+                try:
+                    self.add_history_row(table, msg)
+                except:
+                    continue
+            self.console.print(table)
+            self.message_store.upsert(self.current_chat.id, chunk)
+            shown.extend(m.id for m in chunk)
+            chunk.clear()
+
         try:
-            async for m in self.client.iter_messages(self.current_chat, limit=limit):
-                msgs.append(m)
+            async for m in self.iter_history(limit, **window):
+                chunk.append(m)
+                if len(chunk) >= HISTORY_CHUNK:
+                    flush()
         except:
             self.console.print(f"[red]{self.t('error')}[/red]")
-            return
-
-        table = Table(show_header=False, box=None, padding=(0, 1))
-        table.add_column("ID", style="dim", width=4)
-        table.add_column("Time", style="dim", width=6)
-        table.add_column("Status", width=4)
-        table.add_column("Sender", width=15)
-        table.add_column("Content")
+        if chunk or not shown:
+            flush()
+        print()
 
-        for idx, msg in enumerate(reversed(msgs), 1):
+        # Move the offset-id cursor to the edges of what was just shown
+        if not shown:
+            return
+        if 'after' in window:
+            self.history_bottom = max(shown)
+        elif 'offset_id' in window:
+            self.history_top = min(shown)
+        else:
+            self.history_top, self.history_bottom = min(shown), max(shown)
+
+    def parse_search_args(self, args):
+        """Split search input into query and --all/--since/--until/--page options"""
+        opts = {'all': False, 'since': None, 'until': None, 'page': 1}
+        words = []
+        parts = iter(args.split())
+        for part in parts:
             try:
-                if not (msg.text or msg.media):
-                    continue
-                self.message_cache[self.current_chat.id][msg.id] = msg
-                if msg.id not in self.message_list:
-                    self.message_list.append(msg.id)
-                if msg.out:
-                    key = f"{self.current_chat.id}_{msg.id}"
-                    is_read = hasattr(msg, 'read_date') and msg.read_date is not None
-                    self.message_read_status[key] = is_read
-                if msg.media:
-                    self.image_counter += 1
-                    if msg.id not in [m['msg_id'] for m in self.media_list]:
-                        self.media_list.append({'msg_id': msg.id, 'img_num': self.image_counter})
-
-                sender = "You" if msg.out else (getattr(msg.sender, 'first_name', '?')[:10] if msg.sender else "?")
-                time_str = msg.date.strftime("%H:%M") if msg.date else "--:--"
-                status = self.get_status(msg)
-                # Remove ANSI
-                status = re.sub(r'\x1b\[[0-9;]*m', '', status)
-                
-                media_label = self.format_media_label(msg) if msg.media else ""
-                # Remove ANSI from media label
-                media_label = re.sub(r'\x1b\[[0-9;]*m', '', media_label)
-
-                sender_color = "magenta" if msg.out else "cyan"
-                sender_fmt = f"[{sender_color}]{sender}[/{sender_color}]"
-                self.display_counter = idx
-
-                edit_indicator = "[dim][edited][/dim] " if hasattr(msg, 'edit_date') and msg.edit_date else ""
-
-                if msg.text:
-                    text = self.parse_markdown(msg.text[:80])
-                    content = f"{edit_indicator}{text} {media_label}"
+                if part == '--all':
+                    opts['all'] = True
+                elif part == '--since':
+                    opts['since'] = datetime.strptime(next(parts), '%Y-%m-%d')
+                elif part == '--until':
+                    opts['until'] = datetime.strptime(next(parts), '%Y-%m-%d') + timedelta(days=1)
+                elif part == '--page':
+                    opts['page'] = max(int(next(parts)), 1)
                 else:
-                    content = f"{edit_indicator}{media_label}"
-                
-                table.add_row(str(idx), time_str, status, sender_fmt, content)
-            except:
+                    words.append(part)
+            except (StopIteration, ValueError):
                 continue
-        
-        self.console.print(table)
-        print()
-
-        # Save cache after loading messages
-        self.save_message_cache()
+        return ' '.join(words), opts
+
+    def chat_name(self, chat_id):
+        if self.current_chat and self.current_chat.id == chat_id:
+            return getattr(self.current_chat, 'name', None) or str(chat_id)
+        for d in self.dialogs:
+            if d.id == chat_id:
+                return d.name
+        return str(chat_id)
+
+    async def extend_search_index(self, query, chat, until, limit):
+        """Pull server-side search results into the local index"""
+        by_chat = defaultdict(list)
+        async for msg in self.client.iter_messages(chat, search=query, limit=limit, offset_date=until):
+            by_chat[msg.chat_id].append(msg)
+        for chat_id, msgs in by_chat.items():
+            self.message_store.upsert(chat_id, msgs)
 
     async def search_messages(self, query):
-        if not self.current_chat:
-            self.console.print(f"[yellow]{self.t('no_chat')}[/yellow]")
+        query, opts = self.parse_search_args(query)
+        if not query:
             return
-        self.console.print(f"\n[bold magenta]search: {query}[/bold magenta]")
-        found = 0
-        try:
-            async for msg in self.client.iter_messages(self.current_chat, search=query, limit=15):
-                if msg.text:
-                    found += 1
-                    sender = "You" if msg.out else (getattr(msg.sender, 'first_name', '?')[:10] if msg.sender else "?")
-                    time_str = msg.date.strftime("%H:%M")
-                    text = self.parse_markdown(msg.text[:70])
-                    self.console.print(f"  {found}. [dim]{time_str}[/dim] {sender} | {text}")
-        except:
-            pass
-        if found == 0:
+        chat = None if opts['all'] or not self.current_chat else self.current_chat
+        chat_id = chat.id if chat else None
+        offset = (opts['page'] - 1) * SEARCH_PAGE_SIZE
+        scope = "all chats" if chat is None else "chat"
+        self.console.print(f"\n[bold magenta]search: {escape(query)}[/bold magenta] [dim]{scope}, page {opts['page']}[/dim]")
+
+        search = lambda: self.message_store.search(query, chat_id, opts['since'], opts['until'], SEARCH_PAGE_SIZE, offset)
+        rows = search()
+        if len(rows) < SEARCH_PAGE_SIZE:
+            # Local index is exhausted for this page, let the server extend it
+            try:
+                await self.extend_search_index(query, chat, opts['until'], offset + SEARCH_PAGE_SIZE)
+                rows = search()
+            except:
+                pass
+
+        for found, (row_chat_id, msg_id, date, out, sender, snippet) in enumerate(rows, offset + 1):
+            sender = "You" if out else (sender or "?")[:10]
+            time_str = datetime.fromtimestamp(date).strftime("%d.%m %H:%M") if date else "--:--"
+            where = f"[cyan]{escape(self.chat_name(row_chat_id)[:16])}[/cyan] " if chat is None else ""
+            text = escape((snippet or '').replace('\n', ' ')[:90])
+            text = text.replace('\x02', '[bold magenta]').replace('\x03', '[/bold magenta]')
+            self.console.print(f"  {found}. [dim]{time_str}[/dim] {where}{escape(sender)} | {text}")
+        if not rows:
             self.console.print(f"[dim]{self.t('not_found')}[/dim]")
         print()
 
     async def show_my_profile(self):
         try:
-            me = await self.client.get_me()
+            me = await self.get_me()
             self.console.print(Panel(f"id: {me.id}\nname: {me.first_name} {me.last_name or ''}\nuser: @{me.username or 'none'}", title="Profile", border_style="magenta"))
-            full = await self.client.get_entity(me.id)
+            full = await self.get_entity(me.id)
             if hasattr(full, 'about'):
                 self.console.print(f"  bio: {full.about or 'none'}")
             print()
@@ -637,24 +2346,30 @@ class TelegramCLI:
 
     async def change_username(self, username):
         try:
-            self.animate_send()
-            await self.client(UpdateUsernameRequest(username=username))
+            with self.spinner('saving'):
+                await self.client(functions.account.UpdateUsernameRequest(username=username))
+            self.meta_cache.invalidate('me')
+            self.meta_cache.invalidate('entity')
             self.console.print(f"[green]✓[/green] username @{username}")
         except Exception as e:
             self.console.print(f"[red]✗ {str(e)}[/red]")
 
     async def change_name(self, first_name, last_name=""):
         try:
-            self.animate_send()
-            await self.client(UpdateProfileRequest(first_name=first_name, last_name=last_name))
+            with self.spinner('saving'):
+                await self.client(functions.account.UpdateProfileRequest(first_name=first_name, last_name=last_name))
+            self.meta_cache.invalidate('me')
+            self.meta_cache.invalidate('entity')
             self.console.print(f"[green]✓[/green] name changed")
         except Exception as e:
             self.console.print(f"[red]✗ {str(e)}[/red]")
 
     async def change_bio(self, bio):
         try:
-            self.animate_send()
-            await self.client(UpdateProfileRequest(about=bio))
+            with self.spinner('saving'):
+                await self.client(functions.account.UpdateProfileRequest(about=bio))
+            self.meta_cache.invalidate('me')
+            self.meta_cache.invalidate('entity')
             self.console.print(f"[green]✓[/green] bio changed")
         except Exception as e:
             self.console.print(f"[red]✗ {str(e)}[/red]")
@@ -665,102 +2380,89 @@ class TelegramCLI:
             self.console.print(f"[yellow]{self.t('no_chat')}[/yellow]")
             return
         try:
-            num = int(num) - 1
-            if num < 0 or num >= len(self.message_list):
+            msg_id = self.index.msg_id(int(num))
+            if msg_id is None:
                 self.console.print(f"[dim]invalid message number[/dim]")
                 return
 
-            msg_id = self.message_list[num]
-            msg = await self.client.get_messages(self.current_chat, ids=msg_id)
+            msg = await self.get_message(msg_id)
 
             if not msg or not msg.out:
                 self.console.print(f"[dim]can only edit your own messages[/dim]")
                 return
 
-            self.animate_send()
-            await self.client.edit_message(self.current_chat, msg_id, new_text)
+            with self.spinner('editing'):
+                msg = await self.client.edit_message(self.current_chat, msg_id, new_text)
             self.console.print(f"[green]✓[/green] message edited")
 
             # Update cache
-            msg = await self.client.get_messages(self.current_chat, ids=msg_id)
-            self.message_cache[self.current_chat.id][msg_id] = msg
+            self.cache_message(msg)
 
-        except MessageNotModifiedError:
+        except errors.MessageNotModifiedError:
             self.console.print(f"[dim]message not modified[/dim]")
         except Exception as e:
             self.console.print(f"[red]✗ {str(e)}[/red]")
 
-    async def delete_message(self, num):
-        """Delete a message"""
+    async def delete_message(self, spec):
+        """Delete messages by number, range or list ("3-20,25") in batches"""
         if not self.current_chat:
             self.console.print(f"[yellow]{self.t('no_chat')}[/yellow]")
             return
         try:
-            num = int(num) - 1
-            if num < 0 or num >= len(self.message_list):
-                self.console.print(f"[dim]invalid message number[/dim]")
-                return
-
-            msg_id = self.message_list[num]
-            msg = await self.client.get_messages(self.current_chat, ids=msg_id)
-
-            if not msg:
-                self.console.print(f"[dim]message not found[/dim]")
+            found = await self.resolve_numbers(spec)
+            if not found:
                 return
 
-            # Check if user can delete
-            if not msg.out:
-                # Check if user is admin in group
-                chat = await self.client.get_entity(self.current_chat)
+            # Others' messages need delete rights in groups, checked once per chat
+            ids = [msg.id for msg in found.values() if msg.out]
+            others = [msg.id for msg in found.values() if not msg.out]
+            if others:
+                chat = await self.get_entity(self.current_chat)
                 if isinstance(chat, (types.Channel, types.Chat)):
-                    perms = await self.client.get_permissions(self.current_chat, 'me')
+                    perms = await self.get_my_permissions(self.current_chat)
                     if not perms.delete_messages:
-                        self.console.print(f"[dim]no permission to delete[/dim]")
-                        return
-
-            self.animate_send()
-            await self.client.delete_messages(self.current_chat, [msg_id])
-            self.console.print(f"[green]✓[/green] message deleted")
+                        self.console.print(f"[dim]no permission to delete {len(others)} of them[/dim]")
+                        others = []
+                ids += others
+            if not ids:
+                return
 
-            # Update cache
-            if msg_id in self.message_cache.get(self.current_chat.id, {}):
-                del self.message_cache[self.current_chat.id][msg_id]
-            if msg_id in self.message_list:
-                self.message_list.remove(msg_id)
+            with self.spinner('deleting'):
+                for start in range(0, len(ids), BATCH_SIZE):
+                    batch = ids[start:start + BATCH_SIZE]
+                    await self.client.delete_messages(self.current_chat, batch)
+                    self.forget_messages(self.current_chat.id, batch)
+            self.console.print(f"[green]✓[/green] {plural(len(ids), 'message')} deleted")
 
         except Exception as e:
             self.console.print(f"[red]✗ {str(e)}[/red]")
 
-    async def react_to_message(self, num, emoji):
-        """Add reaction to a message"""
+    async def react_to_message(self, spec, emoji):
+        """React to one or more messages ("3-20,25"); Telegram takes one message per request"""
         if not self.current_chat:
             self.console.print(f"[yellow]{self.t('no_chat')}[/yellow]")
             return
         try:
-            num = int(num) - 1
-            if num < 0 or num >= len(self.message_list):
-                self.console.print(f"[dim]invalid message number[/dim]")
-                return
-
-            msg_id = self.message_list[num]
-            msg = await self.client.get_messages(self.current_chat, ids=msg_id)
-
-            if not msg:
-                self.console.print(f"[dim]message not found[/dim]")
+            found = await self.resolve_numbers(spec)
+            if not found:
                 return
 
-            self.animate_send()
-
-            # Send reaction
-            from telethon.tl.types import ReactionEmoji
-            reaction = [ReactionEmoji(emoticon=emoji)]
-            await self.client(SendReactionRequest(
+            reaction = [types.ReactionEmoji(emoticon=emoji)]
+            requests = [self.client(functions.messages.SendReactionRequest(
                 peer=self.current_chat,
-                msg_id=msg_id,
+                msg_id=msg.id,
                 reaction=reaction
-            ))
-
-            self.console.print(f"[green]✓[/green] reacted with {emoji}")
+            )) for msg in found.values()]
+            # The scheduler paces these against the reaction rate limit
+            with self.spinner('reacting'):
+                results = await asyncio.gather(*requests, return_exceptions=True)
+
+            failed = [r for r in results if isinstance(r, Exception)]
+            done = len(results) - len(failed)
+            if done:
+                self.console.print(f"[green]✓[/green] reacted with {emoji} to {plural(done, 'message')}")
+            if failed:
+                self.console.print(f"[red]✗ {len(failed)} failed: {failed[0]}[/red]")
 
         except Exception as e:
             self.console.print(f"[red]✗ {str(e)}[/red]")
@@ -781,13 +2483,12 @@ class TelegramCLI:
             # Remove @ if present
             username = username.lstrip('@')
 
-            self.animate_send()
-
-            # Get user entity
-            user = await self.client.get_entity(username)
+            with self.spinner('sending'):
+                # Get user entity
+                user = await self.get_entity(username)
 
-            # Send message
-            msg = await self.client.send_message(user, text)
+                # Send message
+                msg = await self.client.send_message(user, text)
 
             self.console.print(f"[green]✓[/green] sent to @{username}")
 
@@ -796,13 +2497,11 @@ class TelegramCLI:
 
     async def logout(self):
         try:
-            self.animate_send()
+            # Save drafts before logout
+            self.flush_drafts()
 
-            # Save cache before logout
-            self.save_message_cache()
-            self.save_drafts()
-
-            await self.client(LogOutRequest())
+            with self.spinner('logging out'):
+                await self.client(functions.auth.LogOutRequest())
             self.console.print(f"[green]✓[/green] logged out")
             self.running = False
             return True
@@ -812,46 +2511,38 @@ class TelegramCLI:
 
     async def pin_message(self, num):
         try:
-            num = int(num) - 1
-            if num < 0 or num >= len(self.message_list):
+            if self.index.msg_id(int(num)) is None:
                 return
             self.console.print(f"[green]✓[/green] pinned")
         except:
             pass
 
-    async def forward_to_saved(self, num):
+    async def forward_to_saved(self, spec):
+        """Forward messages by number, range or list to Saved Messages in batches"""
         if not self.current_chat:
             self.console.print(f"[yellow]{self.t('no_chat')}[/yellow]")
             return
         try:
-            num = int(num) - 1
-            if num < 0 or num >= len(self.message_list):
-                self.console.print(f"[dim]invalid[/dim]")
-                return
-            msg_id = self.message_list[num]
-            msg = await self.client.get_messages(self.current_chat, ids=msg_id)
-            if not msg:
-                self.console.print(f"[dim]no msg[/dim]")
+            found = await self.resolve_numbers(spec)
+            if not found:
                 return
-            me = await self.client.get_me()
-            saved_msgs = await self.client.get_entity(me.id)
-            self.animate_send()
-            await self.client.forward_messages(saved_msgs, msg_id, from_peer=self.current_chat)
-            self.console.print(f"[green]✓[/green] forwarded")
+            ids = sorted(msg.id for msg in found.values())
+            saved_msgs = await self.get_me()
+            with self.spinner('forwarding'):
+                for start in range(0, len(ids), BATCH_SIZE):
+                    await self.client.forward_messages(saved_msgs, ids[start:start + BATCH_SIZE],
+                                                       from_peer=self.current_chat)
+            self.console.print(f"[green]✓[/green] forwarded {plural(len(ids), 'message')}")
         except:
             self.console.print(f"[red]{self.t('error')}[/red]")
 
     async def go_to_saved_messages(self):
         try:
-            me = await self.client.get_me()
-            self.current_chat = await self.client.get_entity(me.id)
+            self.current_chat = await self.get_me()
             self.console.print(f"\n[bold magenta]→[/bold magenta] Saved Messages\n")
             self.message_cache.clear()
-            self.message_list.clear()
-            self.media_list.clear()
-            self.image_counter = 0
-            self.display_counter = 0
-            self.message_read_status.clear()
+            self.index.clear()
+            self.history_top = self.history_bottom = None
             await self.show_messages(15)
         except:
             self.console.print(f"[red]{self.t('error')}[/red]")
@@ -860,10 +2551,10 @@ class TelegramCLI:
         if not self.current_chat:
             self.console.print(f"[yellow]{self.t('no_chat')}[/yellow]")
             return
-        self.animate_send()
         try:
-            msg = await self.client.send_message(self.current_chat, '🎰')
-        except (ChatRestrictedError, ChatWriteForbiddenError):
+            with self.spinner('sending'):
+                msg = await self.client.send_message(self.current_chat, '🎰')
+        except (errors.ChatRestrictedError, errors.ChatWriteForbiddenError):
             self.console.print(f"[red]✗[/red] cannot write")
             return
         except:
@@ -880,48 +2571,418 @@ class TelegramCLI:
         else:
             result = f"[dim]lose {r1}{r2}{r3}[/dim]"
         self.console.print(result)
-        self.message_cache[self.current_chat.id][msg.id] = msg
-        if msg.id not in self.message_list:
-            self.message_list.append(msg.id)
+        self.cache_message(msg)
+
+    def download_path(self, msg):
+        """Stable target path for a message's media, so partial downloads can resume"""
+        media_type, ext = self.get_media_type(msg) or ('media', '')
+        folder = os.path.join(MEDIA_DIR, media_type)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        name = getattr(msg.file, 'name', None) or f"{media_type}{ext}"
+        return os.path.join(folder, f"{abs(self.current_chat.id)}_{msg.id}_{name}")
+
+    async def resolve_numbers(self, spec, media=False):
+        """Map "3-20,25" style display (or media) numbers to messages of the current chat.
+
+        Messages come from the cache, all misses are fetched in one request.
+        Returns {num: msg} in number order, or None if spec does not parse.
+        """
+        try:
+            nums = parse_ranges(spec)
+        except ValueError:
+            self.console.print(f"[dim]invalid {'media' if media else 'message'} number[/dim]")
+            return None
 
-    async def download_img(self, num):
+        lookup = self.index.media_msg_id if media else self.index.msg_id
+        wanted = {n: lookup(n) for n in nums}
+        missing = [n for n, msg_id in wanted.items() if msg_id is None]
+
+        cache = self.message_cache[self.current_chat.id]
+        self.cached_messages(self.current_chat.id, [msg_id for msg_id in wanted.values() if msg_id is not None])
+        misses = [msg_id for msg_id in wanted.values() if msg_id is not None and msg_id not in cache]
+        if misses:
+            try:
+                for msg in await self.client.get_messages(self.current_chat, ids=misses):
+                    if msg:
+                        self.cache_message(msg)
+            except Exception as e:
+                self.console.print(f"[red]✗ {str(e)}[/red]")
+
+        found = {}
+        for num, msg_id in wanted.items():
+            if msg_id is not None and cache.get(msg_id):
+                found[num] = cache[msg_id]
+            elif msg_id is not None:
+                missing.append(num)
+        if missing:
+            self.console.print(f"[dim]not found: {', '.join(map(str, sorted(missing)))}[/dim]")
+        return found
+
+    async def download_img(self, spec):
+        if not self.current_chat:
+            self.console.print(f"[yellow]{self.t('no_chat')}[/yellow]")
+            return
+        found = await self.resolve_numbers(spec, media=True)
+        if not found:
+            return
+
+        chat = self.current_chat
+        queued = 0
+        for num, msg in found.items():
+            msg_id = msg.id
+            if not msg.media:
+                self.console.print(f"[dim]no media: {num}[/dim]")
+                continue
+            refresh = lambda msg_id=msg_id: self.client.get_messages(chat, ids=msg_id)
+            if self.downloads.add(DownloadItem(num, msg, self.download_path(msg), refresh)):
+                queued += 1
+        if queued:
+            self.console.print(f"[dim]queued {queued} download{'s' if queued > 1 else ''}, see ntc --downloads[/dim]")
+
+    def on_download_finished(self, item):
+        if item.status == 'done':
+            source = " [dim](local)[/dim]" if item.local else ""
+            self.console.print(f"[green]✓[/green] {os.path.abspath(item.path)}{source}")
+        else:
+            self.console.print(f"[red]✗[/red] img {item.num}: {item.error}")
+        if self.interactive:
+            self.console.print(f"[bold magenta]>[/bold magenta] ", end="")
+
+    async def wait_downloads(self):
+        """Block until the queue is empty, showing aggregate progress"""
+        with self.transfer_progress('downloads') as callback:
+            join = asyncio.create_task(self.downloads.join())
+            while not join.done():
+                callback(*self.downloads.totals())
+                await asyncio.sleep(0.2)
+
+    def show_downloads(self):
+        if not self.downloads.items:
+            self.console.print(f"[dim]no downloads[/dim]")
+            return
+        table = Table(show_header=True, header_style="bold magenta", box=None)
+        table.add_column("#", style="dim", width=4)
+        table.add_column("file")
+        table.add_column("status")
+        table.add_column("progress", justify="right")
+        table.add_column("speed", justify="right")
+        colors = {'queued': 'dim', 'active': 'cyan', 'done': 'green', 'failed': 'red'}
+        for item in self.downloads.items:
+            percent = f"{item.received * 100 // item.total}%" if item.total else f"{item.received // 1024} KB"
+            speed = f"{item.speed / 1024:.0f} KB/s" if item.status == 'active' else ""
+            status = f"[{colors[item.status]}]{item.status}[/{colors[item.status]}]"
+            if item.local:
+                status += " [dim](local)[/dim]"
+            table.add_row(str(item.num), escape(os.path.basename(item.path)[:40]), status, percent, speed)
+        self.console.print(table)
+        received, total = self.downloads.totals()
+        self.console.print(f"[dim]total {received / 1048576:.1f}/{total / 1048576:.1f} MB[/dim]\n")
+
+    def export_record(self, msg, file=None):
+        """JSON-ready dict of a message for exports, file is the exported media path"""
+        record = {
+            'id': msg.id,
+            'date': msg.date.isoformat() if msg.date else None,
+            'from_id': msg.sender_id,
+            'out': bool(msg.out),
+            'text': msg.message or '',
+        }
+        if msg.action:
+            record['action'] = type(msg.action).__name__.removeprefix('MessageAction')
+        if msg.edit_date:
+            record['edited'] = msg.edit_date.isoformat()
+        if msg.reply_to_msg_id:
+            record['reply_to'] = msg.reply_to_msg_id
+        if msg.grouped_id:
+            record['album'] = msg.grouped_id
+        if msg.fwd_from:
+            fwd = msg.fwd_from
+            record['forwarded_from'] = utils.get_peer_id(fwd.from_id) if fwd.from_id else fwd.from_name
+        if msg.entities:
+            # Offsets stay in UTF-16 code units, as Telegram sends them
+            record['entities'] = [
+                {'type': type(e).__name__.removeprefix('MessageEntity').lower(), 'offset': e.offset, 'length': e.length,
+                 **({'url': e.url} if getattr(e, 'url', None) else {})}
+                for e in msg.entities
+            ]
+        if msg.media:
+            media_type = (self.get_media_type(msg) or ('media', ''))[0]
+            if media_type == 'media':
+                media_type = type(msg.media).__name__.removeprefix('MessageMedia').lower()
+            record['media'] = {'type': media_type}
+            if msg.file:
+                record['media'].update(name=msg.file.name, size=msg.file.size, mime=msg.file.mime_type)
+            if file:
+                record['media']['file'] = file
+        return record
+
+    async def export_media(self, chat, msg, folder, slots):
+        """Download a message's media into the export folder, path relative to EXPORT_DIR or None"""
+        # Same fetcher and media index as img, so files already downloaded are linked, not refetched
+        manager = self.downloads
+        key = MediaStore.key(msg.media)
+        if key is None:
+            return None
+        media_type, ext = self.get_media_type(msg) or ('media', '')
+        path = os.path.join(folder, f"{msg.id}_{getattr(msg.file, 'name', None) or media_type + ext}")
         try:
-            num = int(num)
-            item = next((i for i in self.media_list if i['img_num'] == num), None)
-            if not item:
-                self.console.print(f"[dim]not found[/dim]")
-                return
-            msg = await self.client.get_messages(self.current_chat, ids=item['msg_id'])
-            if not msg or not msg.media:
-                self.console.print(f"[dim]no media[/dim]")
+            async with slots:
+                served = manager.media_store.serve(key, path)
+                if served:
+                    path = served
+                elif not os.path.exists(path):
+                    refresh = lambda: self.client.get_messages(chat, ids=msg.id)
+                    await manager.fetch(DownloadItem(msg.id, msg, path, refresh))
+                manager.media_store.add(key, path)
+            return os.path.relpath(path, EXPORT_DIR)
+        except Exception as e:
+            self.console.print(f"[dim]media of {msg.id} not exported: {type(e).__name__}: {e}[/dim]")
+            return None
+
+    async def export_records(self, messages, chat, media_dir):
+        """Turn a message stream into (id, JSONL line) pairs in order.
+
+        With media_dir, downloads run concurrently but at most EXPORT_MEDIA_WINDOW
+        messages wait for theirs, so memory stays bounded on any chat size.
+        """
+        slots = None
+        if media_dir:
+            os.makedirs(media_dir, exist_ok=True)
+            slots = asyncio.Semaphore(int(self.get_config('download_workers', DOWNLOAD_WORKERS)))
+
+        window = deque()
+        try:
+            async for msg in messages:
+                task = None
+                if media_dir and msg.media:
+                    task = asyncio.create_task(self.export_media(chat, msg, media_dir, slots))
+                window.append((msg, task))
+                # Release finished messages in order, block only when the window is full
+                while window and (len(window) > EXPORT_MEDIA_WINDOW or not window[0][1] or window[0][1].done()):
+                    msg, task = window.popleft()
+                    record = self.export_record(msg, await task if task else None)
+                    yield msg.id, json.dumps(record, ensure_ascii=False).encode() + b'\n'
+            while window:
+                msg, task = window.popleft()
+                record = self.export_record(msg, await task if task else None)
+                yield msg.id, json.dumps(record, ensure_ascii=False).encode() + b'\n'
+        finally:
+            for _, task in window:
+                if task:
+                    task.cancel()
+
+    def save_export_checkpoint(self, f, path, state):
+        """Make the written lines durable, then record how far the export got"""
+        f.flush()
+        os.fsync(f.fileno())
+        state['offset'] = f.tell()
+        tmp_file = f"{path}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as cp:
+            json.dump(state, cp)
+        os.replace(tmp_file, path)
+
+    async def export_chat(self, client, chat, name, media, update):
+        """Stream a chat's history to EXPORT_DIR/<id>.jsonl, resuming from its checkpoint"""
+        # Marked ids: a user and a basic group can share the same bare id
+        path = os.path.join(EXPORT_DIR, f"{chat.id}.jsonl")
+        checkpoint = f"{path}.checkpoint"
+        state = {'last_id': 0, 'offset': 0, 'count': 0}
+        if os.path.exists(checkpoint):
+            try:
+                with open(checkpoint, 'r', encoding='utf-8') as f:
+                    state.update(json.load(f))
+            except:
+                pass
+        if not os.path.exists(path) or os.path.getsize(path) < state['offset']:
+            state = {'last_id': 0, 'offset': 0, 'count': 0}
+        resumed = state['count']
+
+        media_dir = os.path.join(EXPORT_DIR, str(chat.id)) if media else None
+        # wait_time=0: the request scheduler paces history pages, not Telethon's fixed sleep
+        messages = client.iter_messages(chat, reverse=True, offset_id=state['last_id'], wait_time=0)
+        records = self.export_records(messages, chat, media_dir)
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+            # Anything after the checkpoint may be a torn write, it is exported again
+            f.truncate(state['offset'])
+            f.seek(state['offset'])
+            try:
+                async for msg_id, line in records:
+                    f.write(line)
+                    state['last_id'] = msg_id
+                    state['count'] += 1
+                    if state['count'] % EXPORT_CHECKPOINT == 0:
+                        self.save_export_checkpoint(f, checkpoint, state)
+                        update(f"{name}: {state['count']} messages")
+            finally:
+                await records.aclose()
+                self.save_export_checkpoint(f, checkpoint, state)
+        return path, state['count'] - resumed, state['count']
+
+    async def export_chats(self, args):
+        """Export chats by number or range ("1-3,7"), or the current chat, to JSONL"""
+        words = args.split() if args else []
+        media = '--media' in words
+        spec = ' '.join(w for w in words if w != '--media')
+
+        if spec:
+            try:
+                nums = parse_ranges(spec)
+            except ValueError:
+                self.console.print(f"[dim]invalid chat number[/dim]")
                 return
-            media_info = self.get_media_type(msg)
-            folder = os.path.join(MEDIA_DIR, media_info[0]) if media_info else MEDIA_DIR
-            if not os.path.exists(folder):
-                os.makedirs(folder)
-            file_path = await msg.download_media(file=folder)
-            self.console.print(f"[green]✓[/green] {os.path.abspath(file_path)}")
-        except:
-            self.console.print(f"[red]{self.t('error')}[/red]")
+            if not self.dialogs:
+                self.dialogs = self.load_cache() or await self.fetch_dialogs()
+            chats = [self.dialogs[n - 1] for n in nums if 0 < n <= len(self.dialogs)]
+            missing = [n for n in nums if not 0 < n <= len(self.dialogs)]
+            if missing:
+                self.console.print(f"[dim]not found: {', '.join(map(str, missing))}[/dim]")
+        elif self.current_chat:
+            chats = [self.current_chat]
+        else:
+            self.console.print(f"[yellow]{self.t('no_chat')}[/yellow]")
+            return
+        if not chats:
+            return
+
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        async with AsyncExitStack() as stack:
+            client = self.client
+            # A takeout session is Telegram's bulk export mode with lower flood limits.
+            # One left open by an interrupted export is picked up again as is.
+            scopes = {} if self.client.session.takeout_id else dict(
+                users=True, chats=True, megagroups=True, channels=True, files=media)
+            try:
+                client = await stack.enter_async_context(self.client.takeout(finalize=True, **scopes))
+            except errors.TakeoutInitDelayError as e:
+                self.console.print(f"[dim]takeout needs confirming in another Telegram app (or wait {e.seconds}s), "
+                                   f"exporting without it[/dim]")
+            except errors.RPCError as e:
+                self.console.print(f"[dim]takeout unavailable ({e}), exporting without it[/dim]")
+
+            try:
+                with self.spinner('exporting') as update:
+                    for chat in chats:
+                        # Saved Messages and other shortcuts leave a plain entity in current_chat
+                        name = getattr(chat, 'name', None) or utils.get_display_name(chat) or str(chat.id)
+                        update(name)
+                        path, added, total = await self.export_chat(client, chat, name, media, update)
+                        self.console.print(f"[green]✓[/green] {escape(name)}: +{plural(added, 'message')}, "
+                                           f"{total} total → {path}")
+            except Exception as e:
+                # The checkpoint is already saved, running export again resumes
+                self.console.print(f"[red]✗ {str(e)}[/red]")
+
+    def expand_paths(self, spec):
+        """Turn a file, directory or glob into a sorted list of files"""
+        spec = os.path.expanduser(spec.strip())
+        if os.path.isdir(spec):
+            return sorted(os.path.join(spec, f) for f in os.listdir(spec) if os.path.isfile(os.path.join(spec, f)))
+        if glob.has_magic(spec):
+            return sorted(p for p in glob.glob(spec) if os.path.isfile(p))
+        return [spec] if os.path.isfile(spec) else []
+
+    def hash_file(self, path):
+        """Content hash of a file, memoized by path, size and mtime"""
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        if key not in self.file_hashes:
+            h = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1048576), b''):
+                    h.update(block)
+            self.file_hashes[key] = h.hexdigest()
+        return self.file_hashes[key]
+
+    async def upload_parallel(self, path, callback):
+        """Upload file parts concurrently and return the InputFile handle"""
+        size = os.path.getsize(path)
+        parts = max((size + UPLOAD_PART_SIZE - 1) // UPLOAD_PART_SIZE, 1)
+        is_big = size > UPLOAD_BIG_FILE
+        file_id = random.randrange(-2**63, 2**63)
+        pending = list(range(parts - 1, -1, -1))
+        sent = 0
+
+        with open(path, 'rb') as f:
+            async def connection():
+                nonlocal sent
+                while pending:
+                    part = pending.pop()
+                    f.seek(part * UPLOAD_PART_SIZE)
+                    data = f.read(UPLOAD_PART_SIZE)
+                    if is_big:
+                        await self.client(functions.upload.SaveBigFilePartRequest(file_id, part, parts, data))
+                    else:
+                        await self.client(functions.upload.SaveFilePartRequest(file_id, part, data))
+                    sent += len(data)
+                    callback(sent, size)
+
+            await run_concurrently(connection() for _ in range(min(self.file_connections, parts)))
+
+        name = os.path.basename(path)
+        if is_big:
+            return types.InputFileBig(file_id, parts, name)
+        return types.InputFile(file_id, parts, name, '')
+
+    async def get_upload(self, path, callback):
+        """Media handle for a file, uploading only content not sent before"""
+        loop = asyncio.get_running_loop()
+        digest = await loop.run_in_executor(None, self.hash_file, path)
+        if digest not in self.uploads:
+            self.uploads[digest] = await self.upload_parallel(path, callback)
+        else:
+            callback(os.path.getsize(path), os.path.getsize(path))
+        return digest, self.uploads[digest]
+
+    def album_groups(self, paths):
+        """Split files into albums Telegram accepts: photos/videos and documents apart"""
+        visual = [p for p in paths if utils.is_image(p) or utils.is_video(p)]
+        other = [p for p in paths if p not in visual]
+        groups = []
+        for files in (visual, other):
+            groups += [files[i:i + ALBUM_SIZE] for i in range(0, len(files), ALBUM_SIZE)]
+        return groups
 
     async def send_img(self, path):
         if not self.current_chat:
             self.console.print(f"[yellow]{self.t('no_chat')}[/yellow]")
             return
-        if not os.path.exists(path):
+        paths = self.expand_paths(path)
+        if not paths:
             self.console.print(f"[dim]not found[/dim]")
             return
-        self.animate_send()
         try:
-            msg = await self.client.send_file(self.current_chat, path)
-            self.message_cache[self.current_chat.id][msg.id] = msg
-            if msg.id not in self.message_list:
-                self.message_list.append(msg.id)
-            await self.show_msg_animated(msg)
-        except (ChatRestrictedError, ChatWriteForbiddenError):
+            total = sum(os.path.getsize(p) for p in paths)
+            label = os.path.basename(paths[0]) if len(paths) == 1 else f"{len(paths)} files"
+            with self.transfer_progress(label) as callback:
+                progress = {}
+                limit = asyncio.Semaphore(UPLOAD_FILES_CONCURRENCY)
+
+                async def upload(p):
+                    def file_progress(current, _):
+                        progress[p] = current
+                        callback(sum(progress.values()), total)
+                    async with limit:
+                        return await self.get_upload(p, file_progress)
+
+                handles = dict(zip(paths, await run_concurrently(upload(p) for p in paths)))
+
+            for group in self.album_groups(paths):
+                files = [handles[p][1] for p in group]
+                with self.spinner('sending'):
+                    sent = await self.client.send_file(self.current_chat, files if len(files) > 1 else files[0])
+                for p, msg in zip(group, sent if isinstance(sent, list) else [sent]):
+                    # Sent media can be reused forever, unlike the uploaded parts
+                    try:
+                        self.uploads[handles[p][0]] = utils.get_input_media(msg.media)
+                    except TypeError:
+                        pass
+                    self.cache_message(msg)
+                    await self.show_msg_animated(msg)
+        except (errors.ChatRestrictedError, errors.ChatWriteForbiddenError):
             self.console.print(f"[red]✗[/red] cannot write")
-        except:
-            self.console.print(f"[red]{self.t('error')}[/red]")
+        except Exception as e:
+            self.console.print(f"[red]✗ {str(e)}[/red]")
 
     async def send_msg(self, text):
         if not self.current_chat:
@@ -931,14 +2992,12 @@ class TelegramCLI:
         # Clear draft after sending
         self.clear_draft(self.current_chat.id)
 
-        self.animate_send()
         try:
-            msg = await self.client.send_message(self.current_chat, text)
-            self.message_cache[self.current_chat.id][msg.id] = msg
-            if msg.id not in self.message_list:
-                self.message_list.append(msg.id)
+            with self.spinner('sending'):
+                msg = await self.client.send_message(self.current_chat, text)
+            self.cache_message(msg)
             await self.show_msg_animated(msg)
-        except (ChatRestrictedError, ChatWriteForbiddenError):
+        except (errors.ChatRestrictedError, errors.ChatWriteForbiddenError):
             self.console.print(f"[red]✗[/red] cannot write")
         except:
             self.console.print(f"[red]{self.t('error')}[/red]")
@@ -948,16 +3007,14 @@ class TelegramCLI:
             self.console.print(f"[yellow]{self.t('no_chat')}[/yellow]")
             return
         try:
-            num = int(num) - 1
-            if num < 0 or num >= len(self.message_list):
+            reply_to = self.index.msg_id(int(num))
+            if reply_to is None:
                 return
-            self.animate_send()
-            msg = await self.client.send_message(self.current_chat, text, reply_to=self.message_list[num])
-            self.message_cache[self.current_chat.id][msg.id] = msg
-            if msg.id not in self.message_list:
-                self.message_list.append(msg.id)
+            with self.spinner('sending'):
+                msg = await self.client.send_message(self.current_chat, text, reply_to=reply_to)
+            self.cache_message(msg)
             await self.show_msg_animated(msg)
-        except (ChatRestrictedError, ChatWriteForbiddenError):
+        except (errors.ChatRestrictedError, errors.ChatWriteForbiddenError):
             self.console.print(f"[red]✗[/red] cannot write")
         except:
             pass
@@ -969,21 +3026,28 @@ class TelegramCLI:
 [bold white]chats[/bold white]
   ntc --list, ntc -l [n]           show chats
   ntc --select, ntc -s <n>         select chat
+  ntc --folders, ntc -fo           show folders
+  ntc --folder, ntc -fd <n> [page] show chats in folder
   ntc --msg, ntc -m [n]            show messages
-  ntc --search, ntc -sr <text>     search
+                                   [--before|--after] [--page k]
+  ntc --search, ntc -sr <text>     search (offline index)
+                                   [--all] [--since/--until YYYY-MM-DD] [--page n]
   ntc --text, ntc -t @user <text>  send to user
 
 [bold white]messages[/bold white]
   ntc --send, ntc -sd <text>       send message
   ntc --reply, ntc -r <#> <text>   reply
-  ntc --forward, ntc -f <#>        forward to saved
+  ntc --forward, ntc -f <#|1-40>   forward to saved
   ntc --edit <#> <text>            edit message
-  ntc --del, ntc -d <#>            delete message
-  ntc --react <#> <emoji>          add reaction
+  ntc --del, ntc -d <#|3-20,25>    delete messages
+  ntc --react <#|1-5> <emoji>      add reaction
 
 [bold white]media[/bold white]
-  ntc --img, ntc -i <n>            download
-  ntc --send-img, ntc -si <path>   send file
+  ntc --img, ntc -i <n|1-40>       download in background
+  ntc --downloads, ntc -dl         download queue status
+  ntc --send-img, ntc -si <path>   send file, dir or glob as albums
+  ntc --export, ntc -ex <n|1-3>    export chats to exports/*.jsonl
+                                   [--media] resumes where it stopped
 
 [bold white]profile[/bold white]
   ntc --mp                         my profile
@@ -1000,9 +3064,12 @@ class TelegramCLI:
   ntc --logout, ntc -lo            logout
   ntc --saved, ntc -sa             saved messages
   ntc --slots, ntc -sl             slot machine
+  ntc --cache, ntc -ca             cache hit/miss counters
+  ntc --stats, ntc -st             latency, rpc, bytes and cache stats
   ntc --about, ntc -a              about
   ntc --help, ntc -h               help
   ntc --exit, ntc -e               exit
+  ntc daemon [stop]                keep a warm connection for one-shot commands
 """
         self.console.print(Panel(help_text, title="Help", border_style="magenta"))
 
@@ -1052,13 +3119,17 @@ language: python 3.14
         return input(f"{self.get_theme_color('primary')}>{C.RESET} ")
 
     async def run(self):
+        self.interactive = True
         await self.start()
         secondary = self.get_theme_color('secondary')
         self.console.print(f"[dim]type 'ntc --help' for commands[/dim]\n")
-        self.update_task = asyncio.create_task(self.update_read_status_loop())
         loop = asyncio.get_event_loop()
 
+        self.schedule_prefetch()
+
         while self.running:
+            self.busy = False
+            self.last_activity = time.monotonic()
             try:
                 cmd_input = await loop.run_in_executor(None, self.get_input)
             except EOFError:
@@ -1066,125 +3137,228 @@ language: python 3.14
 
             if not cmd_input or not cmd_input.strip():
                 continue
+            self.busy = True
 
             cmd, args, _ = self.parse_command(cmd_input.strip())
 
             if not cmd:
                 continue
-
-            match cmd:
-                case 'list':
-                    limit = int(args) if args and args.isdigit() else None
-                    await self.list_chats(limit)
-                case 'select':
-                    if args:
-                        await self.select_chat(args)
-                case 'msg':
-                    limit = int(args) if args and args.isdigit() else 15
-                    await self.show_messages(limit)
-                case 'search':
-                    if args:
-                        await self.search_messages(args)
-                case 'send':
-                    if args:
-                        await self.send_msg(args)
-                case 'reply':
-                    if args and len(args.split()) >= 2:
-                        parts = args.split(' ', 1)
-                        await self.reply(parts[0], parts[1])
-                case 'forward':
-                    if args:
-                        await self.forward_to_saved(args)
-                case 'edit':
-                    if args and len(args.split()) >= 2:
-                        parts = args.split(' ', 1)
-                        await self.edit_message(parts[0], parts[1])
-                case 'del':
-                    if args:
-                        await self.delete_message(args)
-                case 'react':
-                    if args and len(args.split()) >= 2:
-                        parts = args.split(' ', 1)
-                        await self.react_to_message(parts[0], parts[1])
-                case 'img':
-                    if args:
-                        await self.download_img(args)
-                case 'send-img':
-                    if args:
-                        await self.send_img(args)
-                case 'mp':
-                    await self.show_my_profile()
-                case 'cu':
-                    if args:
-                        await self.change_username(args)
-                case 'name':
-                    if args:
-                        name_parts = args.split(' ', 1)
-                        first = name_parts[0]
-                        last = name_parts[1] if len(name_parts) > 1 else ""
-                        await self.change_name(first, last)
-                case 'bio':
-                    if args:
-                        await self.change_bio(args)
-                case 'theme':
-                    if args:
-                        await self.change_theme(args)
-                case 'language' | 'lang':
-                    if args and args in LANGUAGES:
-                        self.language = args
-                        self.console.print(f"Language changed to {LANGUAGES[args]['name']}")
-                case 'text':
-                    if args and len(args.split()) >= 2:
-                        parts = args.split(' ', 1)
-                        await self.send_to_user(parts[0], parts[1])
-                case 'logout':
-                    if await self.logout():
+            with self.metrics.command(cmd):
+                match cmd:
+                    case 'list':
+                        limit = int(args) if args and args.isdigit() else None
+                        await self.list_chats(limit)
+                    case 'select':
+                        if args:
+                            await self.select_chat(args)
+                    case 'folders':
+                        await self.list_folders()
+                    case 'folder':
+                        if args:
+                            folder_parts = args.split()
+                            await self.show_folder(folder_parts[0], folder_parts[1] if len(folder_parts) > 1 else 1)
+                    case 'msg':
+                        await self.show_messages(**self.parse_history_args(args))
+                    case 'search':
+                        if args:
+                            await self.search_messages(args)
+                    case 'send':
+                        if args:
+                            await self.send_msg(args)
+                    case 'reply':
+                        if args and len(args.split()) >= 2:
+                            parts = args.split(' ', 1)
+                            await self.reply(parts[0], parts[1])
+                    case 'forward':
+                        if args:
+                            await self.forward_to_saved(args)
+                    case 'edit':
+                        if args and len(args.split()) >= 2:
+                            parts = args.split(' ', 1)
+                            await self.edit_message(parts[0], parts[1])
+                    case 'del':
+                        if args:
+                            await self.delete_message(args)
+                    case 'react':
+                        if args and len(args.split()) >= 2:
+                            parts = args.split(' ', 1)
+                            await self.react_to_message(parts[0], parts[1])
+                    case 'img':
+                        if args:
+                            await self.download_img(args)
+                    case 'downloads':
+                        self.show_downloads()
+                    case 'send-img':
+                        if args:
+                            await self.send_img(args)
+                    case 'mp':
+                        await self.show_my_profile()
+                    case 'cu':
+                        if args:
+                            await self.change_username(args)
+                    case 'name':
+                        if args:
+                            name_parts = args.split(' ', 1)
+                            first = name_parts[0]
+                            last = name_parts[1] if len(name_parts) > 1 else ""
+                            await self.change_name(first, last)
+                    case 'bio':
+                        if args:
+                            await self.change_bio(args)
+                    case 'theme':
+                        if args:
+                            await self.change_theme(args)
+                    case 'language' | 'lang':
+                        if args and args in LANGUAGES:
+                            self.language = args
+                            self.console.print(f"Language changed to {LANGUAGES[args]['name']}")
+                    case 'text':
+                        if args and len(args.split()) >= 2:
+                            parts = args.split(' ', 1)
+                            await self.send_to_user(parts[0], parts[1])
+                    case 'logout':
+                        if await self.logout():
+                            break
+                    case 'saved':
+                        await self.go_to_saved_messages()
+                    case 'slots':
+                        await self.slot_machine()
+                    case 'export':
+                        await self.export_chats(args)
+                    case 'cache':
+                        self.show_cache_stats()
+                    case 'stats':
+                        self.show_stats()
+                    case 'about':
+                        self.show_about()
+                    case 'help':
+                        self.show_help()
+                    case 'exit':
+                        self.console.print(f"[dim]exit[/dim]")
+                        self.running = False
                         break
-                case 'saved':
-                    await self.go_to_saved_messages()
-                case 'slots':
-                    await self.slot_machine()
-                case 'about':
-                    self.show_about()
-                case 'help':
-                    self.show_help()
-                case 'exit':
-                    self.console.print(f"[dim]exit[/dim]")
-                    self.running = False
-                    break
-                case 'send_direct':
-                    if self.current_chat:
-                        await self.send_msg(args)
-                case _:
-                    self.console.print(f"[dim]unknown: --{cmd}[/dim]")
+                    case 'send_direct':
+                        if self.current_chat:
+                            await self.send_msg(args)
+                    case _:
+                        self.console.print(f"[dim]unknown: --{cmd}[/dim]")
 
             await asyncio.sleep(0.01)
 
-        if self.update_task:
-            self.update_task.cancel()
-
         # Save everything before exit
-        self.save_message_cache()
-        self.save_drafts()
+        if self._downloads:
+            self._downloads.stop()
+        self.flush_drafts()
+        self.flush_dialogs()
+        if self._message_store:
+            self._message_store.close()
 
         await self.client.disconnect()
 
-async def main():
+    async def serve(self):
+        """Run as a daemon answering one-shot commands over a Unix socket"""
+        await self.start()
+        self.dialogs = self.load_cache()
+        self.dialogs_task = asyncio.create_task(self.refresh_dialogs(quiet=True))
+        self.daemon_lock = asyncio.Lock()
+        self.daemon_stopped = asyncio.Event()
+
+        if os.path.exists(DAEMON_SOCKET):
+            os.remove(DAEMON_SOCKET)
+        # The socket drives the logged-in session, so it is private from the moment it exists
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self.handle_request, path=DAEMON_SOCKET)
+        finally:
+            os.umask(umask)
+        self.console.print(f"[bold magenta]✓[/bold magenta] daemon listening on {DAEMON_SOCKET}")
+        try:
+            await self.daemon_stopped.wait()
+        finally:
+            server.close()
+            await server.wait_closed()
+            if os.path.exists(DAEMON_SOCKET):
+                os.remove(DAEMON_SOCKET)
+            if self._downloads:
+                self._downloads.stop()
+            self.flush_drafts()
+            self.flush_dialogs()
+            if self._message_store:
+                self._message_store.close()
+            await self.client.disconnect()
+
+    async def handle_request(self, reader, writer):
+        """Answer one JSON request line with one JSON reply line"""
+        stop = False
+        try:
+            request = json.loads(await reader.readline())
+            if request.get('op') == 'stop':
+                reply = {'ok': True, 'output': 'daemon stopped\n', 'error': None}
+                stop = True
+            else:
+                async with self.daemon_lock:
+                    reply = await self.run_request(request)
+                stop = reply.pop('stop', False)
+        except Exception as e:
+            reply = {'ok': False, 'output': '', 'error': str(e)}
+        try:
+            writer.write(json.dumps(reply, ensure_ascii=False).encode() + b'\n')
+            await writer.drain()
+        finally:
+            writer.close()
+        # Only shut down once the client has its reply
+        if stop:
+            self.daemon_stopped.set()
+
+    async def run_request(self, request):
+        """Run forwarded argv with output captured for the client's terminal"""
+        usage = io.StringIO()
+        try:
+            with redirect_stderr(usage):
+                args = build_parser().parse_args(request['argv'])
+        except SystemExit:
+            return {'ok': False, 'output': usage.getvalue(), 'error': 'bad arguments'}
+
+        buf = io.StringIO()
+        console = self.console
+        # Colors for the client's terminal, but no spinner frames in the captured output
+        self.console = Console(file=buf, width=request.get('width', 80), force_terminal=request.get('tty', False),
+                               force_interactive=False)
+        started = time.perf_counter()
+        error = None
+        try:
+            with redirect_stdout(buf):
+                await dispatch(self, args)
+        except Exception as e:
+            error = str(e)
+        finally:
+            self.console = console
+        self.flush_drafts()
+        return {'ok': error is None, 'output': buf.getvalue(), 'error': error,
+                'elapsed': round(time.perf_counter() - started, 4), 'stop': bool(args.logout)}
+
+def build_parser():
     parser = argparse.ArgumentParser(prog='ntc', add_help=False)
 
     parser.add_argument('--help', action='store_true')
     parser.add_argument('--about', action='store_true')
     parser.add_argument('--list', nargs='?', const=None)
     parser.add_argument('--select', type=int)
+    parser.add_argument('--folders', action='store_true')
+    parser.add_argument('--folder', type=int, nargs='+', metavar=('NUM', 'PAGE'))
     parser.add_argument('--msg', type=int, nargs='?', const=15)
+    parser.add_argument('--before', action='store_true')
+    parser.add_argument('--after', action='store_true')
+    parser.add_argument('--page', type=int)
     parser.add_argument('--search', type=str)
     parser.add_argument('--send', type=str)
     parser.add_argument('--reply', nargs=2, metavar=('NUM', 'TEXT'))
-    parser.add_argument('--forward', type=int)
+    parser.add_argument('--forward', type=str)
     parser.add_argument('--edit', nargs=2, metavar=('NUM', 'TEXT'))
-    parser.add_argument('--del', type=int, dest='delete')
+    parser.add_argument('--del', type=str, dest='delete')
     parser.add_argument('--react', nargs=2, metavar=('NUM', 'EMOJI'))
-    parser.add_argument('--img', type=int)
+    parser.add_argument('--img', type=str)
+    parser.add_argument('--downloads', action='store_true')
     parser.add_argument('--send-img', type=str)
     parser.add_argument('--mp', action='store_true')
     parser.add_argument('--cu', type=str)
@@ -1196,69 +3370,147 @@ async def main():
     parser.add_argument('--saved', action='store_true')
     parser.add_argument('--slots', action='store_true')
     parser.add_argument('--lang', type=str)
+    parser.add_argument('--cache', action='store_true')
+    parser.add_argument('--stats', action='store_true')
+    parser.add_argument('--export', type=str)
+    parser.add_argument('--media', action='store_true')
+    return parser
+
+async def dispatch(cli, args):
+    """Run the one-shot command selected by parsed arguments"""
+    # Name the command after its option, like "list" or "send"
+    name = next((k for k, v in vars(args).items() if v and k not in ('before', 'after', 'page', 'media')), 'none')
+    with cli.metrics.command(name):
+        if args.help:
+            cli.show_help()
+        elif args.about:
+            cli.show_about()
+        elif args.cache:
+            cli.show_cache_stats()
+        elif args.stats:
+            cli.show_stats()
+        elif args.list is not None:
+            await cli.list_chats(args.list)
+            if cli.dialogs_task:
+                await cli.dialogs_task
+        elif args.select:
+            await cli.select_chat(args.select)
+        elif args.folders:
+            await cli.list_folders()
+        elif args.folder:
+            await cli.show_folder(*args.folder[:2])
+        elif args.msg is not None:
+            await cli.show_messages(args.msg, before=args.before, after=args.after, page=args.page)
+        elif args.search:
+            await cli.search_messages(args.search)
+        elif args.send:
+            await cli.send_msg(args.send)
+        elif args.reply:
+            await cli.reply(args.reply[0], args.reply[1])
+        elif args.forward:
+            await cli.forward_to_saved(args.forward)
+        elif args.edit:
+            await cli.edit_message(args.edit[0], args.edit[1])
+        elif args.delete:
+            await cli.delete_message(args.delete)
+        elif args.react:
+            await cli.react_to_message(args.react[0], args.react[1])
+        elif args.img:
+            await cli.download_img(args.img)
+            await cli.wait_downloads()
+        elif args.downloads:
+            cli.show_downloads()
+        elif args.send_img:
+            await cli.send_img(args.send_img)
+        elif args.export:
+            await cli.export_chats(f"{args.export} --media" if args.media else args.export)
+        elif args.mp:
+            await cli.show_my_profile()
+        elif args.cu:
+            await cli.change_username(args.cu)
+        elif args.name:
+            first = args.name[0]
+            last = ' '.join(args.name[1:]) if len(args.name) > 1 else ""
+            await cli.change_name(first, last)
+        elif args.bio:
+            await cli.change_bio(args.bio)
+        elif args.theme:
+            await cli.change_theme(args.theme)
+        elif args.text:
+            username = args.text[0]
+            text = ' '.join(args.text[1:])
+            await cli.send_to_user(username, text)
+        elif args.logout:
+            await cli.logout()
+        elif args.saved:
+            await cli.go_to_saved_messages()
+        elif args.slots:
+            await cli.slot_machine()
+        elif args.lang:
+            if args.lang in LANGUAGES:
+                cli.language = args.lang
+                print(f"Language changed to {LANGUAGES[args.lang]['name']}")
+
+
+async def send_to_daemon(request):
+    """Send one request to a running daemon, None if no daemon is listening"""
+    if not hasattr(asyncio, 'open_unix_connection') or not os.path.exists(DAEMON_SOCKET):
+        return None
+    try:
+        reader, writer = await asyncio.open_unix_connection(DAEMON_SOCKET)
+    except OSError:
+        return None
+    try:
+        writer.write(json.dumps(request, ensure_ascii=False).encode() + b'\n')
+        await writer.drain()
+        line = await reader.readline()
+    finally:
+        writer.close()
+    return json.loads(line) if line else None
 
-    args = parser.parse_args()
+async def main():
+    if sys.argv[1:2] == ['daemon']:
+        if sys.argv[2:3] == ['stop']:
+            reply = await send_to_daemon({'op': 'stop'})
+            print(reply['output'].strip() if reply else f"{C.GRAY}no daemon running{C.RESET}")
+            return
+        try:
+            await TelegramCLI().serve()
+        except KeyboardInterrupt:
+            print(f"\n{C.GRAY}exit{C.RESET}")
+        return
+
+    args = build_parser().parse_args()
+    given = {name for name, value in vars(args).items() if value}
+
+    if given and given <= LOCAL_OPTIONS:
+        await dispatch(TelegramCLI(), args)
+    elif given:
+        # A running daemon already has a warm connection and caches
+        reply = await send_to_daemon({
+            'argv': sys.argv[1:],
+            'width': shutil.get_terminal_size().columns,
+            'tty': sys.stdout.isatty(),
+        })
+        if reply is not None:
+            sys.stdout.write(reply['output'])
+            if not reply['ok']:
+                print(f"{C.GRAY}error: {reply['error']}{C.RESET}")
+                sys.exit(1)
+            return
+        if given <= DAEMON_OPTIONS:
+            # A fresh process has nothing to report, don't log in just to show that
+            print(f"{C.GRAY}no daemon running, start one with: ntc daemon{C.RESET}")
+            return
 
-    if any(vars(args).values()):
         cli = TelegramCLI()
         try:
             await cli.start()
-
-            if args.help:
-                cli.show_help()
-            elif args.about:
-                cli.show_about()
-            elif args.list is not None:
-                await cli.list_chats(args.list)
-            elif args.select:
-                await cli.select_chat(args.select)
-            elif args.msg is not None:
-                await cli.show_messages(args.msg)
-            elif args.search:
-                await cli.search_messages(args.search)
-            elif args.send:
-                await cli.send_msg(args.send)
-            elif args.reply:
-                await cli.reply(args.reply[0], args.reply[1])
-            elif args.forward:
-                await cli.forward_to_saved(args.forward)
-            elif args.edit:
-                await cli.edit_message(args.edit[0], args.edit[1])
-            elif args.delete:
-                await cli.delete_message(args.delete)
-            elif args.react:
-                await cli.react_to_message(args.react[0], args.react[1])
-            elif args.img:
-                await cli.download_img(args.img)
-            elif args.send_img:
-                await cli.send_img(args.send_img)
-            elif args.mp:
-                await cli.show_my_profile()
-            elif args.cu:
-                await cli.change_username(args.cu)
-            elif args.name:
-                first = args.name[0]
-                last = ' '.join(args.name[1:]) if len(args.name) > 1 else ""
-                await cli.change_name(first, last)
-            elif args.bio:
-                await cli.change_bio(args.bio)
-            elif args.theme:
-                await cli.change_theme(args.theme)
-            elif args.text:
-                username = args.text[0]
-                text = ' '.join(args.text[1:])
-                await cli.send_to_user(username, text)
-            elif args.logout:
-                await cli.logout()
-            elif args.saved:
-                await cli.go_to_saved_messages()
-            elif args.slots:
-                await cli.slot_machine()
-            elif args.lang:
-                if args.lang in LANGUAGES:
-                    cli.language = args.lang
-                    print(f"Language changed to {LANGUAGES[args.lang]['name']}")
-
+            await dispatch(cli, args)
+            if cli._downloads:
+                cli._downloads.stop()
+            cli.flush_drafts()
+            cli.flush_dialogs()
             await cli.client.disconnect()
         except KeyboardInterrupt:
             print(f"\n{C.GRAY}interrupted{C.RESET}")
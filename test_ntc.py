@@ -0,0 +1,113 @@
+"""Regression tests for ntc on the offline fake client from bench_ntc.
+
+    python -m pytest -q test_ntc.py
+"""
+import asyncio
+import io
+import json
+
+import pytest
+from rich.console import Console
+
+import ntc
+from bench_ntc import FakeClient
+
+
+@pytest.fixture(autouse=True)
+def scratch(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+def make_cli(client):
+    cli = ntc.TelegramCLI()
+    cli._client = client
+    cli.console = Console(file=io.StringIO(), width=120)
+    return cli
+
+
+def rows(text):
+    return [line for line in text.splitlines() if 'message ' in line]
+
+
+def output(cli):
+    text = cli.console.file.getvalue()
+    cli.console.file = io.StringIO()
+    return text
+
+
+async def select(cli, num):
+    await cli.list_chats()
+    output(cli)
+    await cli.select_chat(num)
+    if cli.reconcile_task:
+        await cli.reconcile_task
+    return output(cli)
+
+
+def test_warm_select_shows_senders_like_cold():
+    async def run():
+        client = FakeClient(3, 20, media=0)
+        cold = make_cli(client)
+        cold_text = await select(cold, 2)
+        cold.message_store.close()
+
+        warm = make_cli(client)
+        warm_text = await select(warm, 2)
+        warm.message_store.close()
+        return cold_text, warm_text
+
+    cold_text, warm_text = asyncio.run(run())
+    assert 'user1' in cold_text
+    assert rows(warm_text) == rows(cold_text)
+
+
+def test_export_saved_messages_resumes():
+    async def run():
+        client = FakeClient(3, 30, media=0)
+        cli = make_cli(client)
+        await cli.go_to_saved_messages()
+        await cli.export_chats('')
+        # New messages since the first run are appended, nothing is exported twice
+        client.top[client.chat_index(cli.current_chat)] = 35
+        await cli.export_chats('')
+        text = output(cli)
+        cli.message_store.close()
+        return cli.current_chat, text
+
+    me, text = asyncio.run(run())
+    assert '✗' not in text
+    with open(f"{ntc.EXPORT_DIR}/{me.id}.jsonl", encoding='utf-8') as f:
+        ids = [json.loads(line)['id'] for line in f]
+    assert ids == list(range(1, 36))
+
+
+def test_send_after_saved_messages():
+    async def run():
+        client = FakeClient(3, 10, media=0)
+        cli = make_cli(client)
+        await cli.go_to_saved_messages()
+        output(cli)
+        await cli.send_msg('hello')
+        text = output(cli)
+        cli.message_store.close()
+        return text
+
+    text = asyncio.run(run())
+    assert 'hello' in text
+    assert 'error' not in text
+
+
+def test_flush_drafts_wins_over_cancelled_writer():
+    async def run():
+        cli = make_cli(FakeClient(3, 10, media=0))
+        cli.save_draft(1, 'old')
+        stale = cli.pending_drafts_data()
+        cli.save_draft(1, 'new')
+        cli.flush_drafts()
+        # The cancelled writer's executor job finishing late must not roll back
+        await asyncio.get_running_loop().run_in_executor(None, cli.write_drafts, stale)
+        cli.message_store.close()
+
+    asyncio.run(run())
+    with open(ntc.DRAFTS_FILE, encoding='utf-8') as f:
+        assert json.load(f) == {'1': 'new'}